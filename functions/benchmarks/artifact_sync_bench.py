@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Benchmarks the artifact sync paths (copy_source -> extract_zip) of copy-source-zips and
+# artifacts-syncup against an in-process fake S3 with a configurable per-request latency.
+#
+# Reports wall time, requests issued, bytes moved and peak python memory for every
+# module/archive/mode/worker count combination. Results can be recorded as a baseline and
+# later runs compared against it:
+#
+#   python functions/benchmarks/artifact_sync_bench.py --record baseline.json
+#   python functions/benchmarks/artifact_sync_bench.py --compare baseline.json
+#
+# Needs boto3 installed, the handlers import it; their clients are created on first use and
+# replaced by the fake before that, so no AWS access is made. baseline.json next to this script
+# holds the results of the default run, see README.md.
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SOURCE_DIR = os.path.join(ROOT, 'functions', 'source')
+ARTIFACTS_ZIP = os.path.join(ROOT, 'assets', 'pipeline', 'artifacts', 'mcafee-artifacts.zip')
+
+MODULES = {
+    'copy-source-zips': os.path.join(SOURCE_DIR, 'infrastructure', 'copy-source-zips.py'),
+    'artifacts-syncup': os.path.join(SOURCE_DIR, 'infrastructure', 'artifacts-syncup.py'),
+}
+SOURCE_BUCKET = 'bench-source'
+DEST_BUCKET = 'bench-dest'
+PREFIX = 'quickstart-mcafee-epo/'
+ARTIFACTS_ZIP_KEY = 'assets/pipeline/artifacts/mcafee-artifacts.zip'
+
+class FakeBody(object):
+    def __init__(self, s3, data):
+        self._s3 = s3
+        self._data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        data = self._data.read(size)
+        self._s3.count_bytes('out', len(data))
+        return data
+
+    def close(self):
+        pass
+
+class FakePaginator(object):
+    def __init__(self, s3):
+        self._s3 = s3
+
+    def paginate(self, Bucket, Prefix='', **kwargs):
+        keys = sorted(key for bucket, key in list(self._s3.objects) if bucket == Bucket and key.startswith(Prefix))
+        for i in range(0, max(len(keys), 1), 1000):
+            self._s3.request('list_objects_v2')
+            contents = []
+            for key in keys[i:i + 1000]:
+                entry = self._s3.objects[(Bucket, key)]
+                contents.append({'Key': key, 'Size': entry['Size'], 'ETag': '"%s"' % entry['ETag']})
+            yield {'Contents': contents}
+
+class FakeS3(object):
+    # the subset of the S3 client API used by the sync paths, with versioning and multipart ETags
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+        self.uploads = {}
+        self.requests = {}
+        self.bytes = {'in': 0, 'out': 0}
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def request(self, name):
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def count_bytes(self, direction, size):
+        with self._lock:
+            self.bytes[direction] += size
+
+    def _store(self, bucket, key, body, etag=None):
+        with self._lock:
+            self._sequence += 1
+            version_id = 'v%d' % self._sequence
+        # extracted members are never read back, only their size and ETag are kept so the
+        # fake's own storage does not show up in the measured peak memory
+        keep = key.endswith('.zip') or key.endswith('.json')
+        self.objects[(bucket, key)] = {'Body': body if keep else None, 'Size': len(body),
+                                       'ETag': etag or hashlib.md5(body).hexdigest(), 'VersionId': version_id}
+        return version_id
+
+    def _get(self, bucket, key, version_id=None):
+        entry = self.objects.get((bucket, key))
+        if entry is None or entry['Body'] is None or (version_id is not None and version_id != entry['VersionId']):
+            raise Exception('NoSuchKey: %s/%s' % (bucket, key))
+        return entry
+
+    def head_object(self, Bucket, Key, VersionId=None):
+        self.request('head_object')
+        entry = self._get(Bucket, Key, VersionId)
+        return {'ContentLength': entry['Size'], 'ETag': '"%s"' % entry['ETag'], 'VersionId': entry['VersionId']}
+
+    def get_object(self, Bucket, Key, VersionId=None, Range=None, **kwargs):
+        self.request('get_object')
+        entry = self._get(Bucket, Key, VersionId)
+        body = entry['Body']
+        if Range is not None:
+            start, end = re.match(r'bytes=(\d+)-(\d+)', Range).groups()
+            body = body[int(start):int(end) + 1]
+        return {'Body': FakeBody(self, body), 'ETag': '"%s"' % entry['ETag'], 'VersionId': entry['VersionId']}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.request('put_object')
+        body = Body if isinstance(Body, bytes) else bytes(Body)
+        self.count_bytes('in', len(body))
+        return {'ETag': '"%s"' % hashlib.md5(body).hexdigest(), 'VersionId': self._store(Bucket, Key, body)}
+
+    def copy_object(self, CopySource, Bucket, Key, **kwargs):
+        self.request('copy_object')
+        entry = self._get(CopySource['Bucket'], CopySource['Key'], CopySource.get('VersionId'))
+        return {'VersionId': self._store(Bucket, Key, entry['Body'], entry['ETag'])}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.request('delete_object')
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        self.request('delete_objects')
+        for item in Delete['Objects']:
+            self.objects.pop((Bucket, item['Key']), None)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.request('create_multipart_upload')
+        with self._lock:
+            self._sequence += 1
+            upload_id = 'u%d' % self._sequence
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.request('upload_part')
+        body = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        self.count_bytes('in', len(body))
+        self.uploads[UploadId][PartNumber] = body
+        return {'ETag': '"%s"' % hashlib.md5(body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.request('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        bodies = [parts[part['PartNumber']] for part in MultipartUpload['Parts']]
+        digest = hashlib.md5(b''.join(hashlib.md5(body).digest() for body in bodies)).hexdigest()
+        return {'VersionId': self._store(Bucket, Key, b''.join(bodies), '%s-%d' % (digest, len(bodies)))}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.request('abort_multipart_upload')
+        self.uploads.pop(UploadId, None)
+
+    def get_paginator(self, name):
+        return FakePaginator(self)
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, **kwargs):
+        response = self.get_object(Bucket, Key, **(ExtraArgs or {}))
+        with open(Filename, 'wb') as f:
+            f.write(response['Body'].read())
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None, **kwargs):
+        # boto3 managed upload: multipart above the configured threshold
+        body = Fileobj.read()
+        threshold = Config.multipart_threshold if Config is not None else 8 * 1024 * 1024
+        chunksize = Config.multipart_chunksize if Config is not None else 8 * 1024 * 1024
+        if len(body) < threshold:
+            return self.put_object(Bucket, Key, body)
+        upload_id = self.create_multipart_upload(Bucket, Key)['UploadId']
+        parts = []
+        for i in range(0, len(body), chunksize):
+            etag = self.upload_part(Bucket, Key, upload_id, len(parts) + 1, body[i:i + chunksize])['ETag']
+            parts.append({'ETag': etag, 'PartNumber': len(parts) + 1})
+        return self.complete_multipart_upload(Bucket, Key, upload_id, {'Parts': parts})
+
+def synthetic_archive(members, seed=7):
+    # mostly small, compressible text-like members with a few large ones, like the artifacts zip
+    rng = random.Random(seed)
+    words = [b'mcafee', b'epo', b'agent', b'handler', b'dxl', b'broker', b'template', b'Resources', b'Type:', b'\n']
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(members):
+            size = int(rng.lognormvariate(8.5, 1.2))
+            if 0 == i % 500:
+                size = 12 * 1024 * 1024
+            content = b' '.join(rng.choice(words) for j in range(size // 6 + 1))[:size]
+            archive.writestr('synthetic/%04d/member-%05d.template' % (i % 100, i), content)
+    return buf.getvalue()
+
+def load_archive(name):
+    if 'artifacts' == name:
+        with open(ARTIFACTS_ZIP, 'rb') as f:
+            return f.read()
+    return synthetic_archive(int(name.rstrip('k')) * 1000)
+
+def load_module(name):
+    sys.path.insert(0, os.path.join(SOURCE_DIR, 'common'))
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), MODULES[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_once(module, archive, mode, workers, latency, scenario):
+    s3 = FakeS3(latency)
+    s3._store(SOURCE_BUCKET, PREFIX + ARTIFACTS_ZIP_KEY, archive)
+    module.s3 = s3
+    os.environ['EXTRACT_MAX_WORKERS'] = str(workers)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if 'resync' == scenario:
+            # measure a re-run over an unchanged, already extracted destination
+            module.copy_source(SOURCE_BUCKET, DEST_BUCKET, PREFIX, ARTIFACTS_ZIP_KEY, mode)
+            s3.requests.clear()
+            s3.bytes = {'in': 0, 'out': 0}
+        tracemalloc.start()
+        start = time.time()
+        status = module.copy_source(SOURCE_BUCKET, DEST_BUCKET, PREFIX, ARTIFACTS_ZIP_KEY, mode)
+        elapsed = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'wall_seconds': round(elapsed, 3),
+        'requests': sum(s3.requests.values()),
+        'requests_by_operation': dict(sorted(s3.requests.items())),
+        'bytes_in': s3.bytes['in'],
+        'bytes_out': s3.bytes['out'],
+        'peak_memory': peak,
+    }
+
+def compare(results, baseline, tolerance):
+    regressions = 0
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for metric in ['wall_seconds', 'requests', 'bytes_in', 'bytes_out', 'peak_memory']:
+            old, new = baseline[key][metric], result[metric]
+            if old and (new - old) / float(old) > tolerance:
+                regressions += 1
+                print('REGRESSION %s %s: %s -> %s (%+.1f%%)' % (key, metric, old, new, 100.0 * (new - old) / old))
+    print('%d regressions against baseline (tolerance %.0f%%)' % (regressions, tolerance * 100))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='artifact sync benchmark against a fake S3')
+    parser.add_argument('--modules', default=','.join(sorted(MODULES)))
+    parser.add_argument('--archives', default='artifacts,1k,10k', help='artifacts and/or synthetic member counts like 1k,10k')
+    parser.add_argument('--modes', default='stream,download')
+    parser.add_argument('--workers', default='1,4,16')
+    parser.add_argument('--scenario', default='full', choices=['full', 'resync'])
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='latency added to every S3 request')
+    parser.add_argument('--record', help='write the results as a baseline json file')
+    parser.add_argument('--compare', help='compare the results with a baseline json file')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    archives = dict((name, load_archive(name)) for name in args.archives.split(','))
+    results = {}
+    print('%-18s %-10s %-9s %7s %9s %9s %12s %12s %12s' %
+          ('module', 'archive', 'mode', 'workers', 'wall(s)', 'requests', 'bytes in', 'bytes out', 'peak mem'))
+    for module_name in args.modules.split(','):
+        module = load_module(module_name)
+        for archive_name, archive in archives.items():
+            for mode in args.modes.split(','):
+                for workers in [int(w) for w in args.workers.split(',')]:
+                    result = run_once(module, archive, mode, workers, args.latency_ms / 1000.0, args.scenario)
+                    key = '%s/%s/%s/%s/%d' % (module_name, args.scenario, archive_name, mode, workers)
+                    results[key] = result
+                    print('%-18s %-10s %-9s %7d %9.3f %9d %12d %12d %12d%s' %
+                          (module_name, archive_name, mode, workers, result['wall_seconds'], result['requests'],
+                           result['bytes_in'], result['bytes_out'], result['peak_memory'], '' if result['status'] else '  FAILED'))
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('recorded baseline in %s' % args.record)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
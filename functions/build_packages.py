@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Builds the lambda packages under functions/packages from functions/source.
+#
+# Every python handler is zipped together with the modules of functions/source/common it
+# imports, directly or through another common module, all at the root of the zip so the
+# handler imports them as top level modules. functions/source/infrastructure/post-deploy.py
+# becomes functions/packages/infrastructure/post-deploy.zip. The packages are reproducible:
+# entries are sorted and carry a fixed timestamp, so an unchanged source gives an unchanged zip.
+#
+# The functions and templates in assets/pipeline/artifacts/mcafee-artifacts.zip, which the
+# stacks copy into their source store, are refreshed from the repository as well.
+#
+#   python functions/build_packages.py            # rebuild the packages that changed
+#   python functions/build_packages.py --check    # only report outdated packages, exit 1 if any
+#
+# The packages of the javascript handlers have no dependencies and are left as they are.
+import argparse
+import ast
+import io
+import os
+import sys
+import zipfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SOURCE_DIR = os.path.join(ROOT, 'functions', 'source')
+COMMON_DIR = os.path.join(SOURCE_DIR, 'common')
+PACKAGES_DIR = os.path.join(ROOT, 'functions', 'packages')
+ARTIFACTS_ZIP = os.path.join(ROOT, 'assets', 'pipeline', 'artifacts', 'mcafee-artifacts.zip')
+# directories of the artifacts zip mirrored from the repository
+ARTIFACTS_DIRS = ('functions/', 'templates/')
+# the earliest time a zip entry can carry
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def get_common_modules():
+    return dict((name[:-3], os.path.join(COMMON_DIR, name)) for name in os.listdir(COMMON_DIR) if name.endswith('.py'))
+
+def get_imports(path):
+    # top level names of the modules imported by the python file at path
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and 0 == node.level:
+            names.add(node.module.split('.')[0])
+    return names
+
+def get_dependencies(path, common_modules):
+    # the common modules needed by the python file at path, including those of the common modules
+    needed = set()
+    pending = [path]
+    while pending:
+        for name in get_imports(pending.pop()):
+            if name in common_modules and name not in needed:
+                needed.add(name)
+                pending.append(common_modules[name])
+    return sorted(needed)
+
+def zip_entry(name, data):
+    info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info, data
+
+def build_zip(entries):
+    # the bytes of a zip holding the (ZipInfo, data) entries in their order
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as archive:
+        for info, data in entries:
+            archive.writestr(info, data)
+    return buf.getvalue()
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def get_handlers():
+    # (source path, package path) of every handler
+    handlers = []
+    for directory, dirs, files in os.walk(SOURCE_DIR):
+        if os.path.abspath(directory) == COMMON_DIR:
+            dirs[:] = []
+            continue
+        for name in files:
+            if name.endswith('.py'):
+                source = os.path.join(directory, name)
+                package = os.path.join(PACKAGES_DIR, os.path.relpath(directory, SOURCE_DIR), os.path.splitext(name)[0] + '.zip')
+                handlers.append((source, package))
+    return sorted(handlers)
+
+def build_package(source, common_modules):
+    entries = [zip_entry(os.path.basename(source), read_file(source))]
+    for name in get_dependencies(source, common_modules):
+        entries.append(zip_entry(name + '.py', read_file(common_modules[name])))
+    return build_zip(entries)
+
+def build_artifacts(packages):
+    # the artifacts zip with its functions and templates taken from the repository and the
+    # freshly built packages, other entries are kept as they are
+    names = []
+    with zipfile.ZipFile(ARTIFACTS_ZIP) as archive:
+        entries = []
+        for info in archive.infolist():
+            names.append(info.filename)
+            path = os.path.join(ROOT, info.filename)
+            if info.filename.startswith(ARTIFACTS_DIRS) and not info.filename.endswith('/'):
+                if info.filename in packages:
+                    entries.append(zip_entry(info.filename, packages[info.filename]))
+                    continue
+                if os.path.isfile(path):
+                    data = read_file(path)
+                    if data != archive.read(info):
+                        entries.append(zip_entry(info.filename, data))
+                        continue
+            entries.append((info, archive.read(info)))
+    # sources and packages added to the repository since the artifacts zip was built
+    added = [name for name in sorted(packages) if name not in names]
+    for directory, dirs, files in os.walk(SOURCE_DIR):
+        for name in files:
+            if not (name.endswith('.py') or name.endswith('.js')):
+                continue
+            relative = os.path.relpath(os.path.join(directory, name), ROOT).replace(os.sep, '/')
+            if relative not in names:
+                added.append(relative)
+    for name in sorted(added):
+        entries.append(zip_entry(name, packages[name] if name in packages else read_file(os.path.join(ROOT, name))))
+    return build_zip(entries)
+
+def update(path, data, check):
+    # writes data to path unless it already holds it, returns True when path was outdated
+    if os.path.isfile(path) and read_file(path) == data:
+        return False
+    print('%s %s' % ('outdated' if check else 'updated', os.path.relpath(path, ROOT)))
+    if not check:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='build the lambda packages')
+    parser.add_argument('--check', action='store_true', help='only report outdated packages')
+    args = parser.parse_args()
+
+    common_modules = get_common_modules()
+    packages = {}
+    outdated = 0
+    for source, package in get_handlers():
+        data = build_package(source, common_modules)
+        packages[os.path.relpath(package, ROOT).replace(os.sep, '/')] = data
+        outdated += update(package, data, args.check)
+    outdated += update(ARTIFACTS_ZIP, build_artifacts(packages), args.check)
+    print('%d of %d packages %s' % (outdated, len(packages) + 1, 'outdated' if args.check else 'updated'))
+    return 1 if args.check and outdated else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
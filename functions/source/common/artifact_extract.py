@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Used by: copy-source-zips, artifacts-syncup
+#
+# copies the quick start artifacts zip into a bucket and extracts its members next to it. The
+# members are uploaded concurrently within the memory budget of an upload_scheduler, members
+# whose content already matches the destination object are skipped, and the progress is kept
+# in an extract_checkpoint so an extraction stopped by the lambda deadline resumes in a
+# continuation. Which members to extract and what to do with the outcome is up to the caller.
+import os
+import tempfile
+import zipfile
+
+from functools import partial
+from io import BytesIO
+
+import continuation
+import extract_checkpoint
+import s3_zip_stream
+import upload_scheduler
+
+# stream: members are read with ranged GETs and uploaded in parts, nothing is staged in /tmp
+# download: the whole archive is downloaded into /tmp and every member is read into memory
+EXTRACT_MODE_STREAM = 'stream'
+EXTRACT_MODE_DOWNLOAD = 'download'
+
+def extract(s3, zipdata, bucket, prefix, filename, transfer_config=None, dest=None):
+    exract_status = 'success'
+    try:
+        data = zipdata.read(filename)
+        # skip members whose content MD5 already matches the destination object
+        if dest is not None and dest['Size'] == len(data) and \
+                dest['ETag'] in s3_zip_stream.etag_candidates([data], transfer_config.multipart_chunksize):
+            exract_status = 'skip'
+        else:
+            s3.upload_fileobj(BytesIO(data), bucket, prefix + filename, Config=transfer_config)
+    except Exception as e:
+        print('failed to extract file:%s, %s' % (prefix + filename, str(e)))
+        exract_status = 'fail'
+    finally:
+        return prefix + filename, exract_status
+
+def stream_extract(s3, bucket, prefix, artifacts_zip_key, member, version_id, part_size=s3_zip_stream.DEFAULT_PART_SIZE, dest=None):
+    exract_status = 'success'
+    try:
+        if not s3_zip_stream.extract_member(s3, bucket, prefix + artifacts_zip_key, member, bucket, prefix + member.name, version_id, part_size, dest):
+            exract_status = 'skip'
+    except Exception as e:
+        print('failed to extract file:%s, %s' % (prefix + member.name, str(e)))
+        exract_status = 'fail'
+    finally:
+        return prefix + member.name, exract_status
+
+def copy_archive(s3, source_bucket, dest_bucket, key):
+    # copies the archive and returns the version id of the copy, None without versioning
+    copy_source = {
+        'Bucket': source_bucket,
+        'Key': key
+    }
+    print('copy_source: %s' % copy_source)
+    print('dest_bucket = %s'% dest_bucket)
+    print('key = %s' % key)
+    response = s3.copy_object(CopySource=copy_source, Bucket=dest_bucket, Key=key)
+    print(response)
+    if 'VersionId' in response:
+        print('successfully downloaded mcafee artifacts zip from bucket %s' % (source_bucket))
+        return response['VersionId']
+    print('artifacts zip is not copied into regional S3 bucket')
+    return None
+
+def select_all(version_id, entries):
+    return [name for name, crc, size in entries]
+
+def extract_zip(s3, bucket, prefix, artifacts_zip_key, version_id=None, mode=EXTRACT_MODE_STREAM, context=None, resume=False, select=select_all):
+    # extracts the members select picks into bucket under prefix. select is called with the
+    # version id and the (name, crc, size) of every member and returns the names to extract.
+    # Returns None when the lambda deadline is near, the progress is then saved in the checkpoint.
+    # Otherwise returns {'VersionId', 'success', 'skip', 'fail'} with the keys of the members;
+    # failures of earlier invocations of the same extraction count as well. The caller clears
+    # result['Checkpoint'] once it recorded the outcome
+    scheduler = upload_scheduler.UploadScheduler()
+    checkpoint = extract_checkpoint.ExtractCheckpoint.load(s3, bucket, prefix + artifacts_zip_key, None if resume else version_id)
+    if resume:
+        version_id = checkpoint.version_id
+    dest_index = s3_zip_stream.list_destination(s3, bucket, prefix)
+    if EXTRACT_MODE_DOWNLOAD == mode:
+        fd, temp_file = tempfile.mkstemp(suffix='.zip')
+        os.close(fd)
+        try:
+            extra_args = {'VersionId': version_id} if version_id is not None else None
+            s3.download_file(bucket, prefix + artifacts_zip_key, temp_file, ExtraArgs=extra_args)
+            with zipfile.ZipFile(temp_file) as zipdata:
+                checkpoint.version_id = version_id
+                selected = select(version_id, [(info.filename, info.CRC, info.file_size) for info in zipdata.infolist()])
+
+                transfer_config = scheduler.transfer_config()
+                results = scheduler.run([
+                    (filename, zipdata.getinfo(filename).file_size, checkpoint.wrap(partial(extract, s3, zipdata, bucket, prefix, filename, transfer_config, dest_index.get(filename))))
+                    for filename in selected if not checkpoint.is_done(prefix + filename)
+                ], buffered=True, should_continue=continuation.time_guard(context))
+        finally:
+            os.remove(temp_file)
+    else:
+        version_id, members = s3_zip_stream.list_members(s3, bucket, prefix + artifacts_zip_key, version_id)
+        checkpoint.version_id = version_id
+        print('streaming %d members of %s (version %s)' % (len(members), prefix + artifacts_zip_key, version_id))
+        selected = set(select(version_id, [(member.name, member.crc, member.file_size) for member in members]))
+
+        results = scheduler.run([
+            (member.name, member.file_size, checkpoint.wrap(partial(stream_extract, s3, bucket, prefix, artifacts_zip_key, member, version_id, scheduler.part_size, dest_index.get(member.name))))
+            for member in members if member.name in selected and not checkpoint.is_done(prefix + member.name)
+        ], should_continue=continuation.time_guard(context))
+
+    if None in results:
+        checkpoint.save()
+        print('running out of time, %d members left to extract' % results.count(None))
+        return None
+
+    result = {'VersionId': version_id, 'Checkpoint': checkpoint, 'success': [], 'fail': [], 'skip': []}
+    for filename, status in results:
+        result[status].append(filename)
+    print('%d members uploaded, %d unchanged members skipped' % (len(result['success']), len(result['skip'])))
+    result['fail'] = sorted(checkpoint.failed)
+    return result
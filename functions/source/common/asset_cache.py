@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Used by: update-dashboard, post-deploy, post-update
+#
+# caches small S3 assets (email templates, component lists, dashboard templates) in memory
+# and under /tmp together with their ETag. Every read revalidates with a conditional GET, an
+# unchanged asset answers 304 and neither its body nor its parsed form is produced again.
+import hashlib
+import json
+import os
+import threading
+
+from botocore.exceptions import ClientError
+
+CACHE_DIR = '/tmp/assets'
+
+def is_not_modified(e):
+    error = e.response.get('Error', {})
+    status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return 304 == status or error.get('Code') in ('304', 'NotModified')
+
+class AssetCache(object):
+    def __init__(self, s3, cache_dir=CACHE_DIR):
+        self.s3 = s3
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.downloads = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _count(self, hits=0, downloads=0):
+        with self._lock:
+            self.hits += hits
+            self.downloads += downloads
+
+    def _path(self, bucket, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(('%s/%s' % (bucket, key)).encode('utf-8')).hexdigest())
+
+    def _load(self, bucket, key):
+        with self._lock:
+            entry = self._entries.get((bucket, key))
+        if entry is not None:
+            return entry
+        path = self._path(bucket, key)
+        try:
+            with open(path + '.etag') as f:
+                etag = f.read()
+            with open(path, 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        entry = {'ETag': etag, 'Body': body, 'Parsed': {}}
+        with self._lock:
+            self._entries[(bucket, key)] = entry
+        return entry
+
+    def _save(self, bucket, key, entry):
+        with self._lock:
+            self._entries[(bucket, key)] = entry
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            path = self._path(bucket, key)
+            with open(path, 'wb') as f:
+                f.write(entry['Body'])
+            with open(path + '.etag', 'w') as f:
+                f.write(entry['ETag'])
+        except (IOError, OSError) as e:
+            print('failed to cache asset %s/%s, %s' % (bucket, key, str(e)))
+
+    def _get(self, bucket, key):
+        entry = self._load(bucket, key)
+        params = {'Bucket': bucket, 'Key': key}
+        if entry is not None:
+            params['IfNoneMatch'] = entry['ETag']
+        try:
+            response = self.s3.get_object(**params)
+        except ClientError as e:
+            if entry is not None and is_not_modified(e):
+                self._count(hits=1)
+                return entry
+            raise
+        self._count(downloads=1)
+        entry = {'ETag': response['ETag'], 'Body': response['Body'].read(), 'Parsed': {}}
+        self._save(bucket, key, entry)
+        return entry
+
+    def get_bytes(self, bucket, key):
+        # returns (body, etag) of the current version of the asset
+        entry = self._get(bucket, key)
+        return entry['Body'], entry['ETag']
+
+    def get_text(self, bucket, key):
+        # returns (text, etag) of the current version of the asset
+        entry = self._get(bucket, key)
+        if 'text' not in entry['Parsed']:
+            entry['Parsed']['text'] = entry['Body'].decode('utf-8')
+        return entry['Parsed']['text'], entry['ETag']
+
+    def get_json(self, bucket, key):
+        # the parsed asset, shared between calls while the asset is unchanged so treat it as read only
+        entry = self._get(bucket, key)
+        if 'json' not in entry['Parsed']:
+            entry['Parsed']['json'] = json.loads(entry['Body'].decode('utf-8'))
+        return entry['Parsed']['json']
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Used by: all handlers creating boto3 clients or resources
+#
+# creates boto3 clients and resources on first use instead of at import time. Most custom
+# resources only need one or two of the clients their module declares, so a cold start no
+# longer pays for the others. Everything is created from one shared session, so the service
+# models loaded for a client are reused by every later client and resource of that service,
+# and asking twice for the same service, region and options returns the same client.
+#
+#   s3 = aws_clients.client('s3')              # nothing is created yet
+#   s3.list_objects_v2(Bucket=bucket)          # the client is created here and then reused
+#
+# The lazy handles stand in for the client everywhere, a module attribute holding one can be
+# replaced by another object (a fake in the benchmarks) as before.
+#
+# Clients are tuned for reuse: adaptive retries, tcp keepalive, bounded connect and read
+# timeouts and a connection pool as large as the thread pools using them. Options given by the
+# caller override these defaults.
+#
+# Tunable through the environment:
+#   AWS_MAX_POOL_CONNECTIONS - connections kept open per client (default 16)
+#   AWS_CONNECT_TIMEOUT - seconds to establish a connection (default 5)
+#   AWS_READ_TIMEOUT - seconds to wait for a response (default 60)
+#   AWS_MAX_ATTEMPTS - attempts per call, including the first one (default 5)
+import os
+import threading
+import time
+
+import boto3
+
+from botocore.config import Config
+
+# as many connections as the biggest default thread pool (extract uploads, bucket deletes)
+DEFAULT_MAX_POOL_CONNECTIONS = 16
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.RLock()
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+        return _session
+
+def get_env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print('ignoring invalid %s=%s' % (name, os.environ[name]))
+        return default
+
+def get_config(options):
+    # the botocore Config of a client, options override the defaults
+    settings = {
+        'max_pool_connections': get_env_int('AWS_MAX_POOL_CONNECTIONS', DEFAULT_MAX_POOL_CONNECTIONS),
+        'connect_timeout': get_env_int('AWS_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        'read_timeout': get_env_int('AWS_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        'retries': {'mode': 'adaptive', 'total_max_attempts': get_env_int('AWS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)},
+        'tcp_keepalive': True
+    }
+    settings.update(options)
+    try:
+        return Config(**settings)
+    except TypeError:
+        # botocore before 1.27 has no tcp_keepalive option
+        settings.pop('tcp_keepalive')
+        return Config(**settings)
+
+def get_key(service, region_name, options):
+    return (service, region_name, tuple(sorted((name, repr(value)) for name, value in options.items())))
+
+def get_client(service, region_name=None, **options):
+    # the shared client of service, options are botocore Config arguments
+    key = get_key(service, region_name, options)
+    with _lock:
+        if key not in _clients:
+            start = time.time()
+            _clients[key] = get_session().client(service, region_name=region_name, config=get_config(options))
+            print('created %s client in %.0fms' % (service, (time.time() - start) * 1000))
+        return _clients[key]
+
+def get_resource(service, region_name=None, **options):
+    # the shared resource of service, options are botocore Config arguments
+    key = get_key(service, region_name, options)
+    with _lock:
+        if key not in _resources:
+            start = time.time()
+            _resources[key] = get_session().resource(service, region_name=region_name, config=get_config(options))
+            print('created %s resource in %.0fms' % (service, (time.time() - start) * 1000))
+        return _resources[key]
+
+class Lazy(object):
+    def __init__(self, factory, service, region_name, options):
+        self._factory = factory
+        self._args = (service, region_name)
+        self._options = options
+        self._target = None
+
+    def _get(self):
+        if self._target is None:
+            self._target = self._factory(*self._args, **self._options)
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+def client(service, region_name=None, **options):
+    # a handle creating the client on its first use
+    return Lazy(get_client, service, region_name, options)
+
+def resource(service, region_name=None, **options):
+    # a handle creating the resource on its first use
+    return Lazy(get_resource, service, region_name, options)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# Used by: cleanup
+#
+# empties S3 buckets, including every object version and delete marker. Each version is
+# listed exactly once: delimited listings of the top levels split the keyspace into prefix
+# shards, the shards of all buckets are listed in parallel and their keys are removed in
+# DeleteObjects batches of 1000 from a pool of workers shared by all buckets. A purge can be
+# stopped between pages and resumed later from the listing positions of its shards.
+#
+# Tunable through the environment:
+#   PURGE_LIST_WORKERS   - shards listed at the same time (default 8)
+#   PURGE_DELETE_WORKERS - DeleteObjects requests in flight (default 16)
+import os
+import threading
+import time
+
+from concurrent import futures
+
+DELETE_BATCH_SIZE = 1000
+DEFAULT_LIST_WORKERS = 8
+DEFAULT_DELETE_WORKERS = 16
+SHARD_DELIMITER = '/'
+# descend at most this many levels looking for enough prefixes to keep the listers busy
+MAX_SHARD_DEPTH = 3
+
+def get_env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+class PurgeStats(object):
+    def __init__(self):
+        self.deleted = 0
+        self.errors = 0
+        self.start = time.time()
+        self.end = self.start
+        self._lock = threading.Lock()
+
+    def add(self, deleted, errors=0):
+        with self._lock:
+            self.deleted += deleted
+            self.errors += errors
+            self.end = time.time()
+
+    def rate(self):
+        return self.deleted / max(self.end - self.start, 1e-6)
+
+def list_versions(s3, bucket, prefix='', delimiter=None, key_marker=None, version_id_marker=None):
+    # yields (objects, common prefixes, next key marker, next version id marker) for every page of
+    # versions and delete markers under prefix. The markers resume the listing, they are None
+    # after the last page
+    params = {'Bucket': bucket, 'Prefix': prefix, 'MaxKeys': DELETE_BATCH_SIZE}
+    if delimiter:
+        params['Delimiter'] = delimiter
+    while True:
+        if key_marker is not None:
+            params['KeyMarker'] = key_marker
+            if version_id_marker:
+                params['VersionIdMarker'] = version_id_marker
+            else:
+                params.pop('VersionIdMarker', None)
+        page = s3.list_object_versions(**params)
+        objects = [{'Key': item['Key'], 'VersionId': item['VersionId']}
+                   for item in page.get('Versions', []) + page.get('DeleteMarkers', [])]
+        if page.get('IsTruncated'):
+            key_marker = page['NextKeyMarker']
+            version_id_marker = page.get('NextVersionIdMarker')
+        else:
+            key_marker = version_id_marker = None
+        yield objects, [item['Prefix'] for item in page.get('CommonPrefixes', [])], key_marker, version_id_marker
+        if key_marker is None:
+            return
+
+def initial_shards(bucket_names):
+    # a shard is a json serializable listing position, so unfinished shards can be handed on to
+    # a continuation. Delimited shards only cover their own level and split off their prefixes
+    return [{'Bucket': bucket, 'Prefix': '', 'Depth': 0, 'Delimited': True} for bucket in bucket_names]
+
+class BucketPurger(object):
+    def __init__(self, s3, list_workers=None, delete_workers=None):
+        self.s3 = s3
+        self.list_workers = max(1, list_workers or get_env_int('PURGE_LIST_WORKERS', DEFAULT_LIST_WORKERS))
+        self.delete_workers = max(1, delete_workers or get_env_int('PURGE_DELETE_WORKERS', DEFAULT_DELETE_WORKERS))
+        self.stats = {}
+        self.deleted = 0
+        self.errors = 0
+        # bounds the batches waiting for a delete worker, so listing cannot run far ahead of deleting
+        self._pending = threading.BoundedSemaphore(self.delete_workers * 2)
+        self._deleter = None
+
+    def _delete(self, bucket, objects):
+        stats = self.stats[bucket]
+        try:
+            response = self.s3.delete_objects(Bucket=bucket, Delete={'Objects': objects, 'Quiet': True})
+            errors = response.get('Errors', [])
+            for error in errors[:5]:
+                print('failed to delete %s (%s) from bucket %s, %s' % (error.get('Key'), error.get('VersionId'), bucket, error.get('Message')))
+            stats.add(len(objects) - len(errors), len(errors))
+        except Exception as e:
+            print('failed to delete %d objects from bucket %s, %s' % (len(objects), bucket, str(e)))
+            stats.add(0, len(objects))
+        finally:
+            self._pending.release()
+
+    def _submit(self, bucket, objects):
+        if objects:
+            self._pending.acquire()
+            self._deleter.submit(self._delete, bucket, objects)
+
+    def _purge_shard(self, shard, should_continue):
+        # returns (new shards, the unfinished rest of shard or None)
+        bucket = shard['Bucket']
+        delimiter = SHARD_DELIMITER if shard['Delimited'] else None
+        prefixes = []
+        pages = list_versions(self.s3, bucket, shard['Prefix'], delimiter, shard.get('KeyMarker'), shard.get('VersionIdMarker'))
+        rest = None
+        for objects, page_prefixes, key_marker, version_id_marker in pages:
+            self._submit(bucket, objects)
+            prefixes.extend(page_prefixes)
+            if key_marker is not None and not should_continue():
+                rest = dict(shard, KeyMarker=key_marker, VersionIdMarker=version_id_marker)
+                break
+
+        # keep splitting the top levels until there are enough prefixes to keep the listers busy
+        depth = shard['Depth'] + 1
+        delimited = depth < MAX_SHARD_DEPTH and len(prefixes) < self.list_workers
+        return [{'Bucket': bucket, 'Prefix': prefix, 'Depth': depth, 'Delimited': delimited} for prefix in prefixes], rest
+
+    def purge(self, shards, should_continue=None):
+        # purges the shards until they are done or should_continue returns False. Returns the
+        # unfinished shards; all objects listed so far are deleted (or counted as errors) by then
+        if should_continue is None:
+            should_continue = lambda: True
+        for shard in shards:
+            self.stats.setdefault(shard['Bucket'], PurgeStats())
+        start = time.time()
+        remaining = []
+        with futures.ThreadPoolExecutor(max_workers=self.delete_workers) as self._deleter:
+            with futures.ThreadPoolExecutor(max_workers=self.list_workers) as listers:
+                running = set()
+                queue = list(shards)
+                while queue or running:
+                    while queue and len(running) < self.list_workers:
+                        shard = queue.pop(0)
+                        if should_continue():
+                            running.add(listers.submit(self._purge_shard, shard, should_continue))
+                        else:
+                            remaining.append(shard)
+                    if not running:
+                        continue
+                    done, running = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        new_shards, rest = future.result()
+                        queue.extend(new_shards)
+                        if rest is not None:
+                            remaining.append(rest)
+        elapsed = time.time() - start
+
+        for bucket, stats in sorted(self.stats.items()):
+            self.deleted += stats.deleted
+            self.errors += stats.errors
+            print('purged %d objects from bucket %s in %.1fs (%.0f objects/s), %d errors' %
+                  (stats.deleted, bucket, stats.end - stats.start, stats.rate(), stats.errors))
+        print('purged %d objects from %d buckets in %.1fs (%.0f objects/s), %d shards left' %
+              (self.deleted, len(self.stats), elapsed, self.deleted / max(elapsed, 1e-6), len(remaining)))
+        return remaining
+
+def purge_buckets(s3, bucket_names, list_workers=None, delete_workers=None):
+    # empties the buckets in one go, raises when any object could not be deleted
+    purger = BucketPurger(s3, list_workers, delete_workers)
+    purger.purge(initial_shards(bucket_names))
+    if purger.errors:
+        raise Exception('failed to delete %d objects' % purger.errors)
+    return purger.deleted
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Used by: all cloudformation custom resource handlers
+#
+# sends custom resource responses to cloudformation. A lost response leaves the stack waiting
+# for an hour, so the PUT has bounded connect and read timeouts, is retried with jittered
+# backoff until the pre-signed URL answers 200, and a response larger than the 4 KB limit is
+# turned into a failure instead of being rejected. Connections are kept per host and reused.
+import http.client
+import json
+import random
+import time
+import urllib.parse
+
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 10.0
+# cloudformation rejects response bodies above 4096 bytes
+MAX_RESPONSE_SIZE = 4096
+MAX_REASON_LENGTH = 1024
+
+_connections = {}
+
+def get_connection(hostname):
+    connection = _connections.get(hostname)
+    if connection is None:
+        connection = http.client.HTTPSConnection(hostname, timeout=CONNECT_TIMEOUT)
+        _connections[hostname] = connection
+    return connection
+
+def close_connection(hostname):
+    connection = _connections.pop(hostname, None)
+    if connection is not None:
+        connection.close()
+
+def put(url, body):
+    # one PUT of body to the pre-signed url, returns the http status
+    connection = get_connection(url.hostname)
+    if connection.sock is None:
+        connection.connect()
+        connection.sock.settimeout(READ_TIMEOUT)
+    # the pre-signed url is signed without a content type
+    connection.request('PUT', url.path + '?' + url.query, body, headers={'Content-Type': '', 'Content-Length': str(len(body))})
+    result = connection.getresponse()
+    result.read()
+    if result.getheader('Connection', '').lower() == 'close':
+        close_connection(url.hostname)
+    return result.status, result.reason
+
+def encode_response(response):
+    # the json body of response, shortened to the size cloudformation accepts
+    body = json.dumps(response).encode('utf-8')
+    if len(body) <= MAX_RESPONSE_SIZE:
+        return body
+    if len(response.get('Reason', '')) > MAX_REASON_LENGTH:
+        response['Reason'] = response['Reason'][:MAX_REASON_LENGTH]
+        body = json.dumps(response).encode('utf-8')
+    if len(body) > MAX_RESPONSE_SIZE and 'Data' in response:
+        data_size = len(json.dumps(response['Data']))
+        print('response Data of %d bytes does not fit into the %d byte response, keys %s' % (data_size, MAX_RESPONSE_SIZE, ', '.join(sorted(response['Data']))))
+        response.pop('Data')
+        response['Status'] = FAILED
+        response['Reason'] = 'response Data of %d bytes exceeds the %d byte limit' % (data_size, MAX_RESPONSE_SIZE)
+        body = json.dumps(response).encode('utf-8')
+    return body
+
+def send_response(request, response, status=None, reason=None):
+    # completes the response with status and reason and sends it to the ResponseURL of request.
+    # Returns True once cloudformation accepted it
+    if status is not None:
+        response['Status'] = status
+
+    if reason is not None:
+        response['Reason'] = reason
+
+    if 'ResponseURL' not in request or not request['ResponseURL']:
+        return False
+
+    url = urllib.parse.urlparse(request['ResponseURL'])
+    body = encode_response(response)
+    start = time.time()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            status_code, status_reason = put(url, body)
+            if 200 == status_code:
+                print('sent %s response in %.2fs after %d attempts' % (response['Status'], time.time() - start, attempt))
+                return True
+            print('response rejected with %d %s' % (status_code, status_reason))
+            if status_code < 500:
+                # the pre-signed url is expired or the body is invalid, a retry does not help
+                break
+        except Exception as e:
+            print('failed to send the response, attempt %d, %s' % (attempt, str(e)))
+            close_connection(url.hostname)
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+    print('Failed to send the response to the provided URL after %.2fs' % (time.time() - start))
+    return False
+
+def send(event, context, response_status, response_data, physical_resource_id=None, reason=None):
+    # same arguments as the send function of the cfnresponse module
+    response = {
+        'StackId': event['StackId'],
+        'RequestId': event['RequestId'],
+        'LogicalResourceId': event['LogicalResourceId'],
+        'PhysicalResourceId': physical_resource_id or context.log_stream_name,
+        'Data': response_data
+    }
+    if reason is None:
+        reason = 'See the details in CloudWatch Log Stream: ' + context.log_stream_name
+    return send_response(event, response, response_status, reason)
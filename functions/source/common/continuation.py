@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# Used by: copy-source-zips, artifacts-syncup, cleanup
+#
+# lets a long running lambda stop before its deadline and continue the same work in a new
+# asynchronous invocation of itself. The event is passed on unchanged, except for a counter
+# under CONTINUATION_KEY and any state the caller wants to carry over.
+import json
+
+CONTINUATION_KEY = 'Continuation'
+# keep this much time for in-flight work, saving the progress and invoking the continuation
+DEFAULT_RESERVE_MILLIS = 60 * 1000
+MAX_CONTINUATIONS = 20
+
+def get_continuation_count(event):
+    return event.get(CONTINUATION_KEY, {}).get('Count', 0)
+
+def get_continuation_state(event):
+    return event.get(CONTINUATION_KEY, {}).get('State', {})
+
+def time_guard(context, reserve_millis=DEFAULT_RESERVE_MILLIS):
+    # returns a callable telling whether there is still time to start more work
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return lambda: True
+    return lambda: context.get_remaining_time_in_millis() > reserve_millis
+
+def invoke_continuation(lambda_client, event, context, state=None, max_continuations=MAX_CONTINUATIONS):
+    count = get_continuation_count(event) + 1
+    if count > max_continuations:
+        raise Exception('giving up after %d continuations' % max_continuations)
+    next_event = dict(event)
+    next_event[CONTINUATION_KEY] = {'Count': count, 'State': state or {}}
+    print('continuing in invocation %d of %s' % (count, context.invoked_function_arn))
+    lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event', Payload=json.dumps(next_event).encode('utf-8'))
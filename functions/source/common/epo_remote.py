@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Used by: post-deploy, post-epo-deploy
+#
+# client of the ePO Remote API (https://<server>:<port>/remote/<command>?<parameters>). One
+# keep-alive connection is kept per host and port and reused by every command, responses are
+# read completely so the connection stays usable. A kept connection the server closed while it
+# was idle is replaced before it is used. Commands are not idempotent, so a command is only
+# sent again when sending it failed, never once ePO may have run it. ePO answers "OK:" followed
+# by the result or "Error <code>:" followed by a message, errors are raised as EPORemoteError.
+# The latency of every command is logged and kept in latencies.
+#
+# Tunable through the environment:
+#   EPO_REMOTE_CONNECT_TIMEOUT - seconds to connect to the ePO server (default 10)
+#   EPO_REMOTE_READ_TIMEOUT - seconds to wait for the answer of a command (default 60)
+import http.client
+import os
+import re
+import select
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+
+from base64 import b64encode
+
+DEFAULT_CONNECT_TIMEOUT = 10
+# three sequential commands fit into the time post-deploy gives its sub handlers
+DEFAULT_READ_TIMEOUT = 60
+ERROR_PATTERN = re.compile(r'Error\s+(-?\d+)\s*:\s*(.*)', re.DOTALL)
+# failures to send a command on a kept connection the server closed, the command never reached ePO
+STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError)
+
+# (host, port) -> [connection, lock]
+_connections = {}
+_lock = threading.Lock()
+# incremented by close_all, clients created before stop sending commands
+_generation = 0
+
+class EPORemoteError(Exception):
+    def __init__(self, command, status, code, message):
+        super(EPORemoteError, self).__init__('ePO command %s failed with status %s, error %s: %s' % (command, status, code, message))
+        self.command = command
+        self.status = status
+        self.code = code
+
+def get_env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def parse_response(command, status, body):
+    # the result of an "OK:" answer, raises EPORemoteError for anything else
+    text = body.decode('utf-8', 'replace').strip()
+    if text.startswith('OK:'):
+        return text[3:].strip()
+    match = ERROR_PATTERN.match(text)
+    if match:
+        raise EPORemoteError(command, status, int(match.group(1)), match.group(2).strip())
+    if 200 != status:
+        raise EPORemoteError(command, status, None, text[:256])
+    return text
+
+def is_closed(connection):
+    # an idle kept connection only turns readable once the server closed it
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+def get_connection(hostname, port):
+    with _lock:
+        key = (hostname, int(port))
+        if key not in _connections:
+            # ePO servers present a self signed certificate
+            connection = http.client.HTTPSConnection(hostname, int(port), context=ssl._create_unverified_context(),
+                                                     timeout=get_env_int('EPO_REMOTE_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT))
+            _connections[key] = [connection, threading.Lock()]
+        return _connections[key]
+
+class EPOClient(object):
+    def __init__(self, hostname, port, username, password):
+        self.hostname = hostname
+        self.port = port
+        self.headers = {'Authorization': 'Basic %s' % b64encode((username + ':' + password).encode()).decode('ascii')}
+        self.generation = _generation
+        # command -> milliseconds of its last call
+        self.latencies = {}
+
+    def _connect(self, connection):
+        connection.connect()
+        connection.sock.settimeout(get_env_int('EPO_REMOTE_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+
+    def _request(self, connection, path):
+        if connection.sock is not None and is_closed(connection):
+            print('ePO closed the idle connection to %s, reconnecting' % self.hostname)
+            connection.close()
+        reused = connection.sock is not None
+        if not reused:
+            self._connect(connection)
+        try:
+            connection.request('POST', path, headers=self.headers)
+        except STALE_CONNECTION_ERRORS:
+            connection.close()
+            if not reused:
+                raise
+            # the command was not sent, send it once more on a new connection
+            self._connect(connection)
+            connection.request('POST', path, headers=self.headers)
+        # a failure from here on is raised, ePO may have run the command already
+        response = connection.getresponse()
+        return response.status, response.read(), response.will_close
+
+    def call(self, command, **params):
+        # runs /remote/<command> with the url encoded params and returns its result text
+        path = '/remote/' + command
+        if params:
+            path += '?' + urllib.parse.urlencode(params)
+        if self.generation != _generation:
+            raise Exception('ePO connections were closed, command %s not sent' % command)
+        connection, lock = get_connection(self.hostname, self.port)
+        start = time.time()
+        with lock:
+            try:
+                status, body, will_close = self._request(connection, path)
+            except (http.client.HTTPException, socket.error):
+                connection.close()
+                raise
+            if will_close:
+                connection.close()
+        elapsed = (time.time() - start) * 1000
+        self.latencies[command] = elapsed
+        print('ePO command %s answered %d in %.0fms' % (command, status, elapsed))
+        return parse_response(command, status, body)
+
+def close_all():
+    # closes every kept connection, a command waiting for its answer fails at once. Clients
+    # created before do not send further commands
+    global _generation
+    with _lock:
+        _generation += 1
+        for connection, lock in _connections.values():
+            if connection.sock is not None:
+                try:
+                    # wakes up a thread blocked reading from the connection
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+                except (OSError, ValueError):
+                    pass
+            connection.close()
+        _connections.clear()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Used by: copy-source-zips, artifacts-syncup
+#
+# records the progress of an artifact extraction in a small object next to the archive, so
+# an extraction interrupted by the lambda deadline resumes without uploading a member twice.
+# The checkpoint is only valid for the archive version it was written for. It is written at
+# most every SAVE_INTERVAL_SECONDS while members complete, by whichever worker finds it due
+# while the others carry on, and once more when the extraction stops for a continuation.
+# Saves never overlap, so an older snapshot can not overwrite a newer one.
+import json
+import threading
+import time
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+SAVE_INTERVAL_SECONDS = 15
+
+class ExtractCheckpoint(object):
+    def __init__(self, s3, bucket, key, version_id=None, completed=None, failed=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.version_id = version_id
+        self.completed = set(completed or [])
+        self.failed = set(failed or [])
+        self._lock = threading.Lock()
+        # held from taking the snapshot until its PUT returned
+        self._save_lock = threading.Lock()
+        self._saved_at = time.time()
+
+    @classmethod
+    def load(cls, s3, bucket, archive_key, version_id=None):
+        # loads the checkpoint of archive_key; a checkpoint of another version is discarded.
+        # version_id None resumes whatever version the checkpoint was written for
+        key = archive_key + CHECKPOINT_SUFFIX
+        try:
+            data = json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8'))
+        except Exception:
+            return cls(s3, bucket, key, version_id)
+        if version_id is not None and data.get('VersionId') != version_id:
+            print('discarding checkpoint of version %s' % data.get('VersionId'))
+            return cls(s3, bucket, key, version_id)
+        print('resuming from checkpoint of version %s, %d members done' % (data.get('VersionId'), len(data.get('Completed', []))))
+        return cls(s3, bucket, key, data.get('VersionId'), data.get('Completed'), data.get('Failed'))
+
+    def is_done(self, name):
+        return name in self.completed or name in self.failed
+
+    def record(self, name, status):
+        with self._lock:
+            if 'fail' == status:
+                self.failed.add(name)
+            else:
+                self.completed.add(name)
+            due = time.time() - self._saved_at >= SAVE_INTERVAL_SECONDS
+        if due:
+            self.save(wait=False)
+
+    def wrap(self, fn):
+        # wraps an extract function returning (name, status) so its outcome is recorded
+        def run():
+            name, status = fn()
+            self.record(name, status)
+            return name, status
+        return run
+
+    def save(self, wait=True):
+        # writes the checkpoint. Without wait a save already in progress is left to finish and
+        # False is returned
+        if not self._save_lock.acquire(wait):
+            return False
+        try:
+            with self._lock:
+                body = json.dumps({'VersionId': self.version_id, 'Completed': sorted(self.completed), 'Failed': sorted(self.failed)})
+                self._saved_at = time.time()
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode('utf-8'))
+            return True
+        finally:
+            self._save_lock.release()
+
+    def clear(self):
+        with self._save_lock:
+            try:
+                self.s3.delete_object(Bucket=self.bucket, Key=self.key)
+            except Exception as e:
+                print('failed to delete checkpoint %s, %s' % (self.key, str(e)))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Used by: check-stack-details
+#
+# index of the Route 53 hosted zones of the account. The index is built from one paginated
+# list_hosted_zones listing and kept across warm invocations for a short time, lookups are
+# answered from it: exact matches, and the closest enclosing zone of a name.
+#
+# Tunable through the environment:
+#   HOSTED_ZONE_INDEX_TTL_SECONDS - seconds an index is reused (default 60)
+import os
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 60
+
+_index = None
+_lock = threading.Lock()
+
+def normalize(name):
+    # route 53 returns lower case names with a trailing dot
+    name = name.lower()
+    return name if name.endswith('.') else name + '.'
+
+class ZoneIndex(object):
+    def __init__(self, zones):
+        self.zones = {}
+        for zone in zones:
+            self.zones.setdefault(normalize(zone['Name']), []).append(zone)
+        # public zones win over private zones of the same name
+        for name in self.zones:
+            self.zones[name].sort(key=lambda zone: zone.get('Config', {}).get('PrivateZone', False))
+        self.built = time.time()
+
+    @classmethod
+    def build(cls, r53):
+        zones = []
+        paginator = r53.get_paginator('list_hosted_zones')
+        for page in paginator.paginate():
+            zones.extend(page['HostedZones'])
+        print('indexed %d hosted zones' % len(zones))
+        return cls(zones)
+
+    def exists(self, name):
+        return normalize(name) in self.zones
+
+    def find_zone(self, name):
+        # the zone of name itself or else of its closest parent domain, None if there is none
+        labels = normalize(name).split('.')
+        for i in range(len(labels) - 1):
+            zones = self.zones.get('.'.join(labels[i:]))
+            if zones:
+                return zones[0]
+        return None
+
+    def get_zone_id(self, name):
+        zone = self.find_zone(name)
+        return zone['Id'].split('/')[-1] if zone is not None else None
+
+def get_zone_index(r53, ttl=None):
+    # the cached index while it is younger than ttl, otherwise a newly built one
+    global _index
+    if ttl is None:
+        ttl = int(os.environ.get('HOSTED_ZONE_INDEX_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    with _lock:
+        if _index is None or time.time() - _index.built > ttl:
+            _index = ZoneIndex.build(r53)
+        return _index
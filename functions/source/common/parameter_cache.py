@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Used by: post-deploy, post-update, setup-artifacts, post-epo-deploy, sync-epo-instance-parameters
+#
+# read-through cache of parameter store values. A cache created at module level lives as long
+# as the lambda container, so warm invocations reuse the values of earlier ones. Entries expire
+# after a ttl; an expired entry is kept when a describe_parameters call shows its version did
+# not change, which needs no decryption. Names parameter store does not know are cached as
+# missing for the ttl too, so optional parameters are not asked for on every call. Writes and
+# deletes through the cache invalidate the entry. Decrypted SecureStrings are only held in
+# process memory, never written anywhere.
+#
+# Tunable through the environment:
+#   PARAMETER_CACHE_TTL_SECONDS - seconds an entry is used without a version check (default 300)
+import os
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 300
+# get_parameters takes up to 10 names, a describe_parameters name filter up to 50
+GET_BATCH_SIZE = 10
+DESCRIBE_BATCH_SIZE = 50
+
+class ParameterCache(object):
+    def __init__(self, ssm, ttl=None):
+        self.ssm = ssm
+        if ttl is None:
+            ttl = int(os.environ.get('PARAMETER_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+        self.ttl = ttl
+        self.hits = 0
+        self.requests = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _count(self, hits=0, requests=0):
+        with self._lock:
+            self.hits += hits
+            self.requests += requests
+
+    def _usable(self, name, decrypt):
+        # a SecureString read without decryption holds the cipher text, it does not serve a decrypted read
+        entry = self._entries.get(name)
+        return entry is not None and (entry['Missing'] or entry['Decrypted'] or not decrypt or 'SecureString' != entry['Type'])
+
+    def _store(self, parameter, decrypt):
+        with self._lock:
+            self._entries[parameter['Name']] = {'Value': parameter['Value'], 'Type': parameter['Type'], 'Version': parameter['Version'],
+                                                'Decrypted': decrypt, 'Missing': False, 'Expires': time.time() + self.ttl}
+
+    def _store_missing(self, name):
+        with self._lock:
+            self._entries[name] = {'Missing': True, 'Expires': time.time() + self.ttl}
+
+    def _revalidate(self, names):
+        # extends the expired entries whose version is unchanged, the others are dropped
+        versions = {}
+        try:
+            for i in range(0, len(names), DESCRIBE_BATCH_SIZE):
+                params = {'ParameterFilters': [{'Key': 'Name', 'Option': 'Equals', 'Values': names[i:i + DESCRIBE_BATCH_SIZE]}],
+                          'MaxResults': DESCRIBE_BATCH_SIZE}
+                while True:
+                    self._count(requests=1)
+                    response = self.ssm.describe_parameters(**params)
+                    for metadata in response['Parameters']:
+                        versions[metadata['Name']] = metadata['Version']
+                    if not response.get('NextToken'):
+                        break
+                    params['NextToken'] = response['NextToken']
+        except Exception as e:
+            print('failed to check parameter versions, %s' % str(e))
+        now = time.time()
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                if entry is not None and versions.get(name) == entry['Version']:
+                    entry['Expires'] = now + self.ttl
+                else:
+                    self._entries.pop(name, None)
+
+    def get_many(self, names, decrypt=False):
+        # returns {name: value} of the names that exist, fetching the missing ones in batches
+        names = list(dict.fromkeys(names))
+        with self._lock:
+            now = time.time()
+            expired = []
+            for name in names:
+                if self._usable(name, decrypt) and self._entries[name]['Expires'] <= now:
+                    if self._entries[name]['Missing']:
+                        # a missing name has no version to check, it is asked for again
+                        self._entries.pop(name)
+                    else:
+                        expired.append(name)
+        if expired:
+            self._revalidate(expired)
+
+        with self._lock:
+            missing = [name for name in names if not self._usable(name, decrypt)]
+        self._count(hits=len(names) - len(missing))
+        for i in range(0, len(missing), GET_BATCH_SIZE):
+            self._count(requests=1)
+            response = self.ssm.get_parameters(Names=missing[i:i + GET_BATCH_SIZE], WithDecryption=decrypt)
+            for parameter in response['Parameters']:
+                self._store(parameter, decrypt)
+            for name in response.get('InvalidParameters', []):
+                self._store_missing(name)
+
+        with self._lock:
+            return dict((name, self._entries[name]['Value']) for name in names
+                        if self._usable(name, decrypt) and not self._entries[name]['Missing'])
+
+    def get(self, name, decrypt=False, fresh=False):
+        # like get_parameter, a missing parameter raises ParameterNotFound. fresh skips the cached
+        # value, for parameters other functions update while this container is warm
+        if fresh:
+            self.invalidate(name)
+        values = self.get_many([name], decrypt)
+        if name in values:
+            return values[name]
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and entry['Missing']:
+            raise self.ssm.exceptions.ParameterNotFound({'Error': {'Code': 'ParameterNotFound', 'Message': 'Parameter %s not found' % name}},
+                                                        'GetParameter')
+        self._count(requests=1)
+        parameter = self.ssm.get_parameter(Name=name, WithDecryption=decrypt)['Parameter']
+        self._store(parameter, decrypt)
+        return parameter['Value']
+
+    def invalidate(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def put(self, name, value, type, description=''):
+        self.invalidate(name)
+        try:
+            return self.ssm.put_parameter(Name=name, Description=description, Value=value, Type=type, Overwrite=True)
+        finally:
+            self.invalidate(name)
+
+    def put_all(self, parameters, writer):
+        # writes the parameters concurrently through a parameter_store.ParameterWriter
+        names = [parameter['Name'] for parameter in parameters]
+        for name in names:
+            self.invalidate(name)
+        try:
+            writer.put_all(parameters)
+        finally:
+            for name in names:
+                self.invalidate(name)
+
+    def delete_all(self, names, writer):
+        # deletes the parameters in concurrent batches through a parameter_store.ParameterWriter
+        names = list(names)
+        for name in names:
+            self.invalidate(name)
+        try:
+            writer.delete_all(names)
+        finally:
+            for name in names:
+                self.invalidate(name)
+
+    def delete(self, name):
+        self.invalidate(name)
+        try:
+            return self.ssm.delete_parameter(Name=name)
+        finally:
+            self.invalidate(name)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Used by: pre-deploy, post-deploy, post-update
+#
+# writes parameter store parameters concurrently while staying under the SSM write limits.
+# Requests are paced by a token bucket, throttled requests are retried with jittered
+# exponential backoff. The writes go through an ssm client that does not retry on its own, so
+# every throttled request is seen, counted and paced here. The current parameters under a path
+# can be read first, so only the parameters that changed are written, and a whole path can be
+# deleted in batches.
+#
+# Tunable through the environment:
+#   SSM_WRITE_TPS     - sustained write requests per second (default 3, the standard throughput limit)
+#   SSM_WRITE_BURST   - write requests allowed in a burst (default 5)
+#   SSM_WRITE_WORKERS - concurrent write requests (default 4)
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from concurrent import futures
+
+import aws_clients
+
+DEFAULT_WRITE_TPS = 3
+DEFAULT_WRITE_BURST = 5
+DEFAULT_WRITE_WORKERS = 4
+# delete_parameters takes up to 10 names
+DELETE_BATCH_SIZE = 10
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 8.0
+THROTTLING_ERRORS = ('ThrottlingException', 'TooManyUpdates', 'Throttling', 'RequestLimitExceeded')
+# the writer retries throttled requests itself, its client makes a single attempt
+WRITE_CLIENT_RETRIES = {'mode': 'standard', 'total_max_attempts': 1}
+
+def get_env_number(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+class TokenBucket(object):
+    # hands out rate tokens per second, at most burst of them at once
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def get_parameters_by_path(ssm, path, recursive=False):
+    # returns {name: parameter} of the parameters under path with SecureStrings decrypted. The
+    # descriptions, which get_parameters_by_path leaves out, are added from describe_parameters
+    parameters = {}
+    paginator = ssm.get_paginator('get_parameters_by_path')
+    for page in paginator.paginate(Path=path, Recursive=recursive, WithDecryption=True):
+        for parameter in page['Parameters']:
+            parameters[parameter['Name']] = {'Name': parameter['Name'], 'Value': parameter['Value'], 'Type': parameter['Type'], 'Description': ''}
+    option = 'Recursive' if recursive else 'OneLevel'
+    paginator = ssm.get_paginator('describe_parameters')
+    for page in paginator.paginate(ParameterFilters=[{'Key': 'Path', 'Option': option, 'Values': [path]}]):
+        for metadata in page['Parameters']:
+            if metadata['Name'] in parameters:
+                parameters[metadata['Name']]['Description'] = metadata.get('Description', '')
+    return parameters
+
+def list_parameter_names(ssm, path, recursive=True):
+    # names of the parameters under path, values are not decrypted
+    names = []
+    paginator = ssm.get_paginator('get_parameters_by_path')
+    for page in paginator.paginate(Path=path, Recursive=recursive, WithDecryption=False):
+        names.extend(parameter['Name'] for parameter in page['Parameters'])
+    return names
+
+def get_changed_parameters(current, parameters):
+    # the parameters whose value, type or description differ from the current ones
+    changed = []
+    for parameter in parameters:
+        existing = current.get(parameter['Name'])
+        if existing is None or any(existing[field] != parameter.get(field, '') for field in ('Value', 'Type', 'Description')):
+            changed.append(parameter)
+    return changed
+
+def is_throttling(e):
+    return isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+class ParameterWriter(object):
+    def __init__(self, ssm=None, rate=None, burst=None, max_workers=None):
+        # ssm defaults to the shared client without retries
+        self.ssm = ssm if ssm is not None else aws_clients.get_client('ssm', retries=WRITE_CLIENT_RETRIES)
+        self.bucket = TokenBucket(rate or get_env_number('SSM_WRITE_TPS', DEFAULT_WRITE_TPS),
+                                  burst or get_env_number('SSM_WRITE_BURST', DEFAULT_WRITE_BURST))
+        self.max_workers = max(1, int(max_workers or get_env_number('SSM_WRITE_WORKERS', DEFAULT_WRITE_WORKERS)))
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def call(self, fn, **kwargs):
+        # calls an ssm write api within the rate limit, retrying throttled requests
+        for attempt in range(MAX_ATTEMPTS):
+            self.bucket.acquire()
+            try:
+                return fn(**kwargs)
+            except Exception as e:
+                if not is_throttling(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                with self._lock:
+                    self.throttled += 1
+                time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+    def put(self, name, value, type, description=''):
+        return self.call(self.ssm.put_parameter, Name=name, Description=description, Value=value, Type=type, Overwrite=True)
+
+    def run(self, action, fn, items, noun='parameters'):
+        # applies fn to all items concurrently, raises the first error once every item is done
+        start = time.time()
+        errors = []
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_map = dict((executor.submit(fn, item), item) for item in items)
+            for future in futures.as_completed(future_map):
+                try:
+                    future.result()
+                except Exception as e:
+                    # never log a parameter dict, it holds the value
+                    item = future_map[future]
+                    print('failed to %s %s, %s' % (action, item['Name'] if isinstance(item, dict) else item, str(e)))
+                    errors.append(e)
+        print('%s %d %s in %.2fs, %d throttled requests retried, %d failed' %
+              (action, len(future_map), noun, time.time() - start, self.throttled, len(errors)))
+        if errors:
+            raise errors[0]
+
+    def put_all(self, parameters):
+        # parameters are dicts of Name, Value, Type and Description
+        def put(parameter):
+            self.put(parameter['Name'], parameter['Value'], parameter['Type'], parameter.get('Description', ''))
+        self.run('put', put, parameters)
+
+    def delete_all(self, names):
+        # deletes in batches of 10, names that do not exist are ignored
+        def delete(batch):
+            response = self.call(self.ssm.delete_parameters, Names=batch)
+            if response.get('InvalidParameters'):
+                print('%d parameters were already deleted' % len(response['InvalidParameters']))
+        names = list(names)
+        batches = [names[i:i + DELETE_BATCH_SIZE] for i in range(0, len(names), DELETE_BATCH_SIZE)]
+        self.run('delete', delete, batches, 'batches of parameters')
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# Used by: copy-source-zips, artifacts-syncup
+#
+# streams the members of a zip archive stored in S3 into S3 objects without staging the
+# archive on local disk. The central directory is read with ranged GETs, every member is
+# decompressed while it is read and uploaded in bounded parts, so memory use depends on the
+# part size and not on the size of the archive or of its biggest member.
+#
+# Lambda packages importing this module must bundle it next to the handler file.
+import collections
+import hashlib
+import io
+import struct
+import zipfile
+import zlib
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+RANGE_BLOCK_SIZE = 64 * 1024
+
+ZipMember = collections.namedtuple('ZipMember', [
+    'name', 'crc', 'compress_type', 'compress_size', 'file_size', 'header_offset', 'end_offset', 'flag_bits'
+])
+
+class S3RangeReader(io.RawIOBase):
+    # read only, seekable view of an S3 object served by ranged GETs with a small read-ahead block
+    def __init__(self, s3, bucket, key, version_id=None, block_size=RANGE_BLOCK_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.block_size = block_size
+        params = {'Bucket': bucket, 'Key': key}
+        if version_id is not None:
+            params['VersionId'] = version_id
+        head = s3.head_object(**params)
+        self.size = head['ContentLength']
+        self.version_id = version_id if version_id is not None else head.get('VersionId')
+        self.requests = 1
+        self._pos = 0
+        self._buf = b''
+        self._buf_start = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError('invalid whence %s' % whence)
+        if pos < 0:
+            raise ValueError('negative seek position %d' % pos)
+        self._pos = pos
+        return self._pos
+
+    def _fetch(self, start, end):
+        params = {'Bucket': self.bucket, 'Key': self.key, 'Range': 'bytes=%d-%d' % (start, end - 1)}
+        if self.version_id is not None:
+            params['VersionId'] = self.version_id
+        self.requests += 1
+        return self.s3.get_object(**params)['Body'].read()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._pos
+        end = min(self._pos + size, self.size)
+        if end <= self._pos:
+            return b''
+        buf_end = self._buf_start + len(self._buf)
+        if not (self._buf_start <= self._pos and end <= buf_end):
+            # read ahead a whole block; near the end of the object anchor the block to the end,
+            # so the end of central directory record and a small central directory come in one GET
+            fetch_end = min(max(end, self._pos + self.block_size), self.size)
+            fetch_start = min(self._pos, max(0, fetch_end - self.block_size))
+            self._buf = self._fetch(fetch_start, fetch_end)
+            self._buf_start = fetch_start
+        data = self._buf[self._pos - self._buf_start:end - self._buf_start]
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+def list_members(s3, bucket, key, version_id=None):
+    # returns (version_id, members) read from the central directory of the archive
+    reader = S3RangeReader(s3, bucket, key, version_id)
+    with zipfile.ZipFile(reader) as archive:
+        infos = archive.infolist()
+        start_dir = archive.start_dir
+
+    # a member's data ends where the next local header (or the central directory) starts
+    offsets = sorted(set(info.header_offset for info in infos)) + [start_dir]
+    next_offset = dict(zip(offsets[:-1], offsets[1:]))
+
+    members = []
+    for info in infos:
+        if info.filename.endswith('/'):
+            continue
+        members.append(ZipMember(info.filename, info.CRC, info.compress_type, info.compress_size,
+                                 info.file_size, info.header_offset, next_offset[info.header_offset], info.flag_bits))
+    return reader.version_id, members
+
+def _read_exact(body, size):
+    data = b''
+    while len(data) < size:
+        chunk = body.read(size - len(data))
+        if not chunk:
+            raise zipfile.BadZipFile('unexpected end of archive data')
+        data += chunk
+    return data
+
+def iter_member(s3, bucket, key, member, version_id=None, chunk_size=READ_CHUNK_SIZE):
+    # yields the uncompressed content of a member in chunks of at most chunk_size bytes
+    if member.flag_bits & 0x1:
+        raise zipfile.BadZipFile('encrypted member %s is not supported' % member.name)
+    if member.compress_type == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    elif member.compress_type == zipfile.ZIP_STORED:
+        decompressor = None
+    else:
+        raise zipfile.BadZipFile('unsupported compression %d for member %s' % (member.compress_type, member.name))
+
+    params = {'Bucket': bucket, 'Key': key, 'Range': 'bytes=%d-%d' % (member.header_offset, member.end_offset - 1)}
+    if version_id is not None:
+        params['VersionId'] = version_id
+    body = s3.get_object(**params)['Body']
+    try:
+        header = struct.unpack(zipfile.structFileHeader, _read_exact(body, zipfile.sizeFileHeader))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile('bad local file header for member %s' % member.name)
+        _read_exact(body, header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+        crc = 0
+        remaining = member.compress_size
+        while remaining > 0:
+            data = body.read(min(chunk_size, remaining))
+            if not data:
+                raise zipfile.BadZipFile('unexpected end of data for member %s' % member.name)
+            remaining -= len(data)
+            if decompressor is None:
+                crc = zlib.crc32(data, crc)
+                yield data
+                continue
+            # bound the output of every step so a highly compressed member cannot blow up memory
+            while data:
+                out = decompressor.decompress(data, chunk_size)
+                data = decompressor.unconsumed_tail
+                if out:
+                    crc = zlib.crc32(out, crc)
+                    yield out
+        if decompressor is not None:
+            out = decompressor.flush()
+            if out:
+                crc = zlib.crc32(out, crc)
+                yield out
+        if crc != member.crc:
+            raise zipfile.BadZipFile('bad CRC-32 for member %s' % member.name)
+    finally:
+        body.close()
+
+def list_destination(s3, bucket, prefix):
+    # one paginated listing of the destination prefix, indexed by the name relative to prefix
+    index = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get('Contents', []):
+            index[item['Key'][len(prefix):]] = {'ETag': item['ETag'].strip('"'), 'Size': item['Size']}
+    return index
+
+def etag_candidates(chunks, part_size=DEFAULT_PART_SIZE):
+    # ETags the content would get from a single PUT and from a multipart upload with part_size parts
+    part_size = max(part_size, MIN_PART_SIZE)
+    content_md5 = hashlib.md5()
+    part_digests = []
+    part_md5 = hashlib.md5()
+    part_len = 0
+    for chunk in chunks:
+        content_md5.update(chunk)
+        view = memoryview(chunk)
+        while len(view):
+            take = min(part_size - part_len, len(view))
+            part_md5.update(view[:take])
+            part_len += take
+            view = view[take:]
+            if part_len == part_size:
+                part_digests.append(part_md5.digest())
+                part_md5 = hashlib.md5()
+                part_len = 0
+    if part_len:
+        part_digests.append(part_md5.digest())
+    candidates = set([content_md5.hexdigest()])
+    if part_digests:
+        candidates.add('%s-%d' % (hashlib.md5(b''.join(part_digests)).hexdigest(), len(part_digests)))
+    return candidates
+
+def upload_stream(s3, chunks, bucket, key, part_size=DEFAULT_PART_SIZE, expected_etag=None):
+    # uploads an iterable of byte chunks, using a single PUT when it fits into one part.
+    # Returns False when the content fits into one part and its MD5 matches expected_etag,
+    # the object is left untouched then.
+    part_size = max(part_size, MIN_PART_SIZE)
+    buf = bytearray()
+    upload_id = None
+    parts = []
+
+    def upload_part(body):
+        response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=body)
+        parts.append({'ETag': response['ETag'], 'PartNumber': len(parts) + 1})
+
+    try:
+        for chunk in chunks:
+            view = memoryview(chunk)
+            while len(buf) + len(view) >= part_size:
+                # fill the buffer up to exactly one part and hand it over as it is, a new buffer
+                # takes the rest, so a part is never copied and at most one part plus one chunk
+                # is held
+                fill = part_size - len(buf)
+                buf += view[:fill]
+                view = view[fill:]
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                upload_part(buf)
+                buf = bytearray()
+            buf += view
+
+        if upload_id is None:
+            if expected_etag is not None and hashlib.md5(buf).hexdigest() == expected_etag:
+                return False
+            s3.put_object(Bucket=bucket, Key=key, Body=buf)
+            return True
+
+        if buf:
+            upload_part(buf)
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        return True
+    except Exception:
+        if upload_id is not None:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+def extract_member(s3, bucket, key, member, dest_bucket, dest_key, version_id=None, part_size=DEFAULT_PART_SIZE, dest=None):
+    # streams a single member from the archive into dest_bucket/dest_key. dest is the listing
+    # entry of the existing destination object; returns False when its content already matches
+    expected_etag = None
+    if dest is not None and dest['Size'] == member.file_size:
+        expected_etag = dest['ETag']
+        if member.file_size >= max(part_size, MIN_PART_SIZE):
+            # too big to buffer, hash it in a read only pass and upload only when it differs
+            if expected_etag in etag_candidates(iter_member(s3, bucket, key, member, version_id), part_size):
+                return False
+            expected_etag = None
+    chunks = iter_member(s3, bucket, key, member, version_id)
+    return upload_stream(s3, chunks, dest_bucket, dest_key, part_size, expected_etag)
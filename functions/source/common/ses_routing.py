@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Used by: pre-deploy, post-deploy, post-update
+#
+# routes SES calls to the region an email identity is verified in. SES identities are verified
+# per region and every deployment before this module verified its addresses in us-west-2, so
+# before the first call for an identity its verification status is looked up in all candidate
+# regions at once. Regions where it is verified are tried first, then regions where its
+# verification is pending, then the rest in order: the region of the stack, then the fallback
+# regions. A region that can not be reached, does not offer SES to the account or has not
+# verified the identity moves the call on to the next region. Any other error, a rejected
+# message or missing permission included, is raised. The region serving each call is logged
+# and kept in served_regions.
+#
+# Tunable through the environment:
+#   SES_REGIONS - comma separated regions tried in this order (default: the region of the
+#                 lambda function, then us-west-2, us-east-1, eu-west-1)
+import email.utils
+import os
+import time
+
+from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError
+from concurrent import futures
+
+import aws_clients
+
+DEFAULT_FALLBACK_REGIONS = ['us-west-2', 'us-east-1', 'eu-west-1']
+# error codes of a region that does not offer SES to the account (not enabled, no endpoint)
+REGION_ERRORS = ('InvalidClientTokenId', 'UnrecognizedClientException', 'OptInRequired')
+# error codes of a region where the identity is not verified
+IDENTITY_ERRORS = ('MailFromDomainNotVerifiedException',)
+# the argument naming the email identity of an operation
+IDENTITY_ARGUMENTS = {'send_email': 'Source', 'send_raw_email': 'Source', 'verify_email_identity': 'EmailAddress'}
+# verification statuses, the better the lower
+STATUS_ORDER = {'Success': 0, 'Pending': 1}
+
+# operation name -> region that served its last call
+served_regions = {}
+# email address -> regions ordered by its verification status
+_identity_regions = {}
+_regions = None
+
+def get_regions():
+    # the regions to try in order, limited to the regions offering SES
+    global _regions
+    if _regions is None:
+        if os.environ.get('SES_REGIONS'):
+            regions = [region.strip() for region in os.environ['SES_REGIONS'].split(',') if region.strip()]
+        else:
+            regions = [os.environ.get('AWS_REGION')] + DEFAULT_FALLBACK_REGIONS
+        available = aws_clients.get_session().get_available_regions('ses')
+        _regions = []
+        for region in regions:
+            if region and region not in _regions and (not available or region in available):
+                _regions.append(region)
+        print('ses regions %s' % ', '.join(_regions))
+    return _regions
+
+def get_verification_status(region, identities):
+    # the best verification status of the identities in region, None when none is known there
+    try:
+        response = aws_clients.get_client('ses', region_name=region).get_identity_verification_attributes(Identities=identities)
+    except (ClientError, ConnectTimeoutError, EndpointConnectionError) as e:
+        print('failed to check ses identities in %s, %s' % (region, str(e)))
+        return None
+    statuses = [attributes['VerificationStatus'] for attributes in response['VerificationAttributes'].values()]
+    statuses = [status for status in statuses if status in STATUS_ORDER]
+    return min(statuses, key=STATUS_ORDER.get) if statuses else None
+
+def get_identity_regions(address):
+    # the regions ordered by the verification status of the address or of its domain
+    if address not in _identity_regions:
+        regions = get_regions()
+        identities = [address]
+        if '@' in address:
+            identities.append(address.split('@', 1)[1])
+        with futures.ThreadPoolExecutor(max_workers=max(1, len(regions))) as executor:
+            statuses = list(executor.map(lambda region: get_verification_status(region, identities), regions))
+        for region, status in zip(regions, statuses):
+            if status is not None:
+                print('ses identity %s is %s in %s' % (address, status, region))
+        order = dict((region, (STATUS_ORDER.get(status, len(STATUS_ORDER)), i)) for i, (region, status) in enumerate(zip(regions, statuses)))
+        _identity_regions[address] = sorted(regions, key=order.get)
+    return _identity_regions[address]
+
+def is_region_error(e):
+    code = e.response.get('Error', {}).get('Code')
+    if code in REGION_ERRORS or code in IDENTITY_ERRORS:
+        return True
+    # SES rejects mail from an address it has not verified in the region, other rejections stand
+    return 'MessageRejected' == code and 'not verified' in e.response.get('Error', {}).get('Message', '')
+
+def call(operation, **kwargs):
+    # calls the ses client operation in the first region able to serve it
+    error = None
+    regions = get_regions()
+    if operation in IDENTITY_ARGUMENTS and kwargs.get(IDENTITY_ARGUMENTS[operation]):
+        address = email.utils.parseaddr(kwargs[IDENTITY_ARGUMENTS[operation]])[1].lower()
+        if address:
+            regions = get_identity_regions(address)
+    for region in regions:
+        ses = aws_clients.get_client('ses', region_name=region)
+        start = time.time()
+        try:
+            response = getattr(ses, operation)(**kwargs)
+        except ClientError as e:
+            if not is_region_error(e):
+                raise
+            error = e
+        except (ConnectTimeoutError, EndpointConnectionError) as e:
+            error = e
+        else:
+            print('ses %s served by %s in %.0fms' % (operation, region, (time.time() - start) * 1000))
+            served_regions[operation] = region
+            return response
+        print('ses %s not served by %s, %s' % (operation, region, str(error)))
+    if error is None:
+        raise Exception('no region to call ses %s in' % operation)
+    raise error
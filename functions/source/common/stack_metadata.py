@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Used by: pre-deploy, check-stack-details
+#
+# describes a stack together with its root and parent stacks. The stack itself is described on
+# every call, its root and parent are described concurrently once its RootId is known. One
+# deployment fires many custom resources against the same stacks, so the root and parent are
+# memoized in memory and in /tmp for a short time, keyed by the StackId, LastUpdatedTime and
+# StackStatus of the stack they were read for. An update of the stack changes the key and its
+# root and parent are described again.
+#
+# Tunable through the environment:
+#   STACK_METADATA_TTL_SECONDS - seconds memoized root and parent stacks are used (default 60)
+import hashlib
+import json
+import os
+import threading
+import time
+
+from concurrent import futures
+
+CACHE_DIR = '/tmp/stack-metadata'
+DEFAULT_TTL_SECONDS = 60
+STACK_FIELDS = ['StackId', 'StackName', 'RootId', 'ParentId', 'StackStatus', 'Parameters', 'Outputs', 'CreationTime', 'LastUpdatedTime']
+
+_memory = {}
+_lock = threading.Lock()
+
+def get_ttl():
+    return int(os.environ.get('STACK_METADATA_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+
+def get_cache_path(stack_name):
+    return os.path.join(CACHE_DIR, hashlib.sha1(stack_name.encode('utf-8')).hexdigest() + '.json')
+
+def get_key(stack):
+    # identifies one revision of a stack, outputs of an update are final once its status changes
+    return [stack['StackId'], stack.get('LastUpdatedTime', stack.get('CreationTime')), stack['StackStatus']]
+
+def describe_stack(cfn, stack_name):
+    stack = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+    # keep what is json serializable and needed, timestamps as strings
+    return dict((field, str(stack[field]) if field.endswith('Time') else stack[field]) for field in STACK_FIELDS if field in stack)
+
+def describe_stacks(cfn, stack_ids):
+    # describes the stacks concurrently, in the order of stack_ids
+    if len(stack_ids) < 2:
+        return [describe_stack(cfn, stack_id) for stack_id in stack_ids]
+    with futures.ThreadPoolExecutor(max_workers=len(stack_ids)) as executor:
+        return list(executor.map(lambda stack_id: describe_stack(cfn, stack_id), stack_ids))
+
+def load(stack_name):
+    with _lock:
+        entry = _memory.get(stack_name)
+    if entry is not None:
+        return entry
+    try:
+        with open(get_cache_path(stack_name)) as f:
+            entry = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    with _lock:
+        _memory[stack_name] = entry
+    return entry
+
+def save(stack_name, entry):
+    with _lock:
+        _memory[stack_name] = entry
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        path = get_cache_path(stack_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError) as e:
+        print('failed to cache stack metadata of %s, %s' % (stack_name, str(e)))
+
+def get_stack_metadata(cfn, stack_name):
+    # returns {'Stack': stack, 'Root': root stack, 'Parent': parent stack}, Root and Parent are
+    # None for a root stack
+    stack = describe_stack(cfn, stack_name)
+    key = get_key(stack)
+    entry = load(stack_name)
+    if entry is not None and entry.get('Key') == key and entry['Expires'] > time.time():
+        print('stack %s unchanged since %s' % (stack_name, key[1]))
+        return {'Stack': stack, 'Root': entry['Root'], 'Parent': entry['Parent']}
+
+    root = parent = None
+    if 'RootId' in stack:
+        stack_ids = [stack['RootId']]
+        if stack.get('ParentId', stack['RootId']) != stack['RootId']:
+            stack_ids.append(stack['ParentId'])
+        stacks = describe_stacks(cfn, stack_ids)
+        root = stacks[0]
+        parent = stacks[-1]
+    save(stack_name, {'Key': key, 'Expires': time.time() + get_ttl(), 'Root': root, 'Parent': parent})
+    return {'Stack': stack, 'Root': root, 'Parent': parent}
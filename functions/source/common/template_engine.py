@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Used by: update-dashboard
+#
+# renders @placeholder@ templates. A template is scanned once into its literal chunks and an
+# index of placeholder offsets, rendering is a single join of chunks and values. Values are
+# inserted as they are, they are not interpreted as regex replacements. Compiled templates
+# are cached by the ETag of the object they were read from.
+import re
+import threading
+
+PLACEHOLDER_PATTERN = re.compile(r'@([A-Za-z0-9_.]+)@')
+
+_templates = {}
+_lock = threading.Lock()
+
+class TemplateError(Exception):
+    pass
+
+class Template(object):
+    def __init__(self, text):
+        self.chunks = []
+        self.names = []
+        # placeholder name -> offsets of its occurrences in the text
+        self.offsets = {}
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.chunks.append(text[pos:match.start()])
+            self.names.append(match.group(1))
+            self.offsets.setdefault(match.group(1), []).append(match.start())
+            pos = match.end()
+        self.chunks.append(text[pos:])
+
+    def render(self, values, strict=True):
+        # values maps placeholder names (without the @) to their text. Placeholders without a
+        # value raise a TemplateError when strict, otherwise they are left in place
+        unfilled = sorted(name for name in self.offsets if values.get(name) is None)
+        unknown = sorted(name for name in values if name not in self.offsets)
+        if unknown:
+            print('values without a placeholder in the template: %s' % ', '.join(unknown))
+        if unfilled:
+            if strict:
+                raise TemplateError('placeholders without a value: %s' % ', '.join(unfilled))
+            print('placeholders left unfilled: %s' % ', '.join(unfilled))
+
+        parts = [self.chunks[0]]
+        for name, chunk in zip(self.names, self.chunks[1:]):
+            value = values.get(name)
+            parts.append('@%s@' % name if value is None else value)
+            parts.append(chunk)
+        return ''.join(parts)
+
+def compile_template(text, etag=None):
+    # the compiled template of text, reused while the source object keeps its etag
+    if etag is None:
+        return Template(text)
+    with _lock:
+        template = _templates.get(etag)
+    if template is None:
+        template = Template(text)
+        with _lock:
+            _templates[etag] = template
+    return template
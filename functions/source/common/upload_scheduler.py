@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Used by: copy-source-zips, artifacts-syncup
+#
+# schedules member uploads of an artifact extraction. Concurrency is sized from the lambda
+# memory setting and a bytes-in-flight budget, the largest members start first so the long
+# tail finishes sooner, and throughput is reported for every member.
+#
+# Tunable through the environment:
+#   EXTRACT_BYTES_IN_FLIGHT_MB - memory budget for members being uploaded (default 25% of lambda memory)
+#   EXTRACT_PART_SIZE_MB       - multipart part size and multipart threshold (default 8)
+#   EXTRACT_MAX_WORKERS        - upper bound for the worker threads (default 16)
+import os
+import threading
+import time
+
+from concurrent import futures
+
+MB = 1024 * 1024
+DEFAULT_MEMORY_SIZE = 128 * MB
+BUDGET_MEMORY_FRACTION = 0.25
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_MAX_WORKERS = 16
+# memory held by a streamed member besides its part buffer (decompressor window and read chunk)
+STREAM_OVERHEAD = 512 * 1024
+
+def get_memory_size():
+    memory_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    return int(memory_mb) * MB if memory_mb else DEFAULT_MEMORY_SIZE
+
+def get_env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+class ByteBudget(object):
+    # counting semaphore over bytes; a request larger than the budget waits until nothing else is in flight
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size):
+        with self._cond:
+            while self.in_flight > 0 and self.in_flight + size > self.limit:
+                self._cond.wait()
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self, size):
+        with self._cond:
+            self.in_flight -= size
+            self._cond.notify_all()
+
+class UploadScheduler(object):
+    def __init__(self, bytes_in_flight=None, part_size=None, max_workers=None):
+        if bytes_in_flight is None:
+            bytes_in_flight = get_env_int('EXTRACT_BYTES_IN_FLIGHT_MB', 0) * MB or int(get_memory_size() * BUDGET_MEMORY_FRACTION)
+        if part_size is None:
+            part_size = get_env_int('EXTRACT_PART_SIZE_MB', 0) * MB or DEFAULT_PART_SIZE
+        if max_workers is None:
+            max_workers = get_env_int('EXTRACT_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+        self.bytes_in_flight = bytes_in_flight
+        self.part_size = part_size
+        self.multipart_threshold = part_size
+        self.max_workers = max(1, max_workers)
+        self.stats = []
+        self._lock = threading.Lock()
+
+    def transfer_config(self):
+        # TransferConfig for boto3 managed uploads of members that are already in memory
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(multipart_threshold=self.multipart_threshold, multipart_chunksize=self.part_size,
+                              max_concurrency=2, use_threads=True)
+
+    def member_cost(self, size, buffered=False):
+        # buffered members are read into memory as a whole, streamed ones hold at most one part
+        if buffered:
+            return size
+        return min(size, self.part_size) + STREAM_OVERHEAD
+
+    def get_workers(self, costs):
+        if not costs:
+            return 1
+        average_cost = max(sum(costs) // len(costs), 1)
+        return max(1, min(self.max_workers, len(costs), self.bytes_in_flight // average_cost))
+
+    def _run_job(self, budget, name, size, cost, fn, should_continue):
+        budget.acquire(cost)
+        if should_continue is not None and not should_continue():
+            budget.release(cost)
+            return None
+        start = time.time()
+        try:
+            return fn()
+        finally:
+            elapsed = time.time() - start
+            budget.release(cost)
+            with self._lock:
+                self.stats.append((name, size, elapsed))
+            print('processed %s: %d bytes in %.3fs (%.2f MB/s)' % (name, size, elapsed, size / MB / max(elapsed, 1e-6)))
+
+    def run(self, jobs, buffered=False, should_continue=None):
+        # jobs are (name, size, fn) tuples, returns the results of fn in the order of jobs.
+        # Once should_continue returns False no further job is started, their result is None
+        jobs = list(jobs)
+        order = sorted(range(len(jobs)), key=lambda i: jobs[i][1], reverse=True)
+        costs = [min(self.member_cost(size, buffered), self.bytes_in_flight) for name, size, fn in jobs]
+        workers = self.get_workers(costs)
+        budget = ByteBudget(self.bytes_in_flight)
+        print('scheduling %d uploads on %d workers, bytes in flight budget %d, part size %d' %
+              (len(jobs), workers, self.bytes_in_flight, self.part_size))
+
+        start = time.time()
+        results = [None] * len(jobs)
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            future_map = {}
+            for i in order:
+                name, size, fn = jobs[i]
+                future_map[i] = executor.submit(self._run_job, budget, name, size, costs[i], fn, should_continue)
+            for i, future in future_map.items():
+                results[i] = future.result()
+        elapsed = time.time() - start
+
+        done = [jobs[i] for i in range(len(jobs)) if results[i] is not None]
+        total = sum(size for name, size, fn in done)
+        print('processed %d of %d members, %d bytes in %.3fs (%.2f MB/s), peak bytes in flight %d' %
+              (len(done), len(jobs), total, elapsed, total / MB / max(elapsed, 1e-6), budget.peak))
+        return results
@@ -1,69 +1,96 @@
 #!/usr/bin/env python3
 import json
-import boto3
 
-import os
-import tempfile
-import zipfile
+import artifact_extract
+import aws_clients
+import continuation
+import upload_scheduler
 
-from concurrent import futures
-from io import BytesIO
+# one connection per extract upload worker
+s3 = aws_clients.client('s3', max_pool_connections=upload_scheduler.get_env_int('EXTRACT_MAX_WORKERS', upload_scheduler.DEFAULT_MAX_WORKERS))
+s3_resource = aws_clients.resource('s3')
+ssm = aws_clients.client('ssm')
+lambda_client = aws_clients.client('lambda')
 
-s3 = boto3.client('s3')
-s3_resource = boto3.resource('s3')
-ssm = boto3.client('ssm')
+# member name, CRC32 and size of the last synced archive, kept next to the archive in the destination
+ARTIFACTS_MANIFEST_SUFFIX = '.manifest.json'
 
-def extract(bucket, prefix, filename):
-    exract_status = 'success'
+def get_manifest_key(prefix, artifacts_zip_key):
+    return prefix + artifacts_zip_key + ARTIFACTS_MANIFEST_SUFFIX
+
+def build_manifest(version_id, entries):
+    # entries are (name, crc, size) tuples taken from the zip central directory
+    return {'VersionId': version_id, 'Members': {name: {'CRC': crc, 'Size': size} for name, crc, size in entries}}
+
+def load_manifest(bucket, prefix, artifacts_zip_key):
     try:
-        s3.upload_fileobj(BytesIO(zipdata.read(filename)), bucket, prefix + filename)
+        response = s3.get_object(Bucket=bucket, Key=get_manifest_key(prefix, artifacts_zip_key))
+        return json.loads(response['Body'].read().decode('utf-8'))
     except Exception as e:
-        print('failed to extract file:%s, %s' % (prefix + filename, str(e)))
-        exract_status = 'fail'
-    finally:
-        return prefix + filename, exract_status
-
-def extract_zip(bucket, prefix, artifacts_zip_key):
-    global zipdata
-    temp_file = tempfile.mktemp()
-    s3.download_file(bucket, prefix + artifacts_zip_key, temp_file)
-    zipdata = zipfile.ZipFile(temp_file)
-
-    with futures.ThreadPoolExecutor(max_workers=4) as executor:
-        future_list = [
-            executor.submit(extract, bucket, prefix, filename)
-            for filename in zipdata.namelist()
-        ]
-
-    result = {'success': [], 'fail': []}
-    for future in future_list:
-        filename, status = future.result()
-        result[status].append(filename)
-
-    if 0 == len(result['fail']):
+        print('no artifacts manifest found, doing a full sync, %s' % (str(e)))
+        return None
+
+def save_manifest(bucket, prefix, artifacts_zip_key, manifest):
+    s3.put_object(Bucket=bucket, Key=get_manifest_key(prefix, artifacts_zip_key), Body=json.dumps(manifest).encode('utf-8'))
+
+def diff_manifest(previous, current):
+    # returns the members to upload (added or changed) and the ones to delete (removed)
+    if previous is None:
+        return list(current['Members']), []
+    old_members = previous.get('Members', {})
+    changed = [name for name, entry in current['Members'].items() if old_members.get(name) != entry]
+    removed = [name for name in old_members if name not in current['Members']]
+    return changed, removed
+
+def delete_members(bucket, prefix, names):
+    failed = []
+    for i in range(0, len(names), 1000):
+        batch = names[i:i + 1000]
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': prefix + name} for name in batch], 'Quiet': True})
+        for error in response.get('Errors', []):
+            print('failed to delete file:%s, %s' % (error['Key'], error.get('Message')))
+            failed.append(error['Key'][len(prefix):])
+    return failed
+
+def extract_zip(bucket, prefix, artifacts_zip_key, version_id=None, mode=artifact_extract.EXTRACT_MODE_STREAM, context=None, resume=False):
+    # returns None when the lambda deadline is near, the progress is then saved in the checkpoint
+    previous_manifest = load_manifest(bucket, prefix, artifacts_zip_key)
+    state = {}
+
+    def select(version_id, entries):
+        # only the members changed since the last synced version are extracted
+        state['manifest'] = build_manifest(version_id, entries)
+        changed, state['removed'] = diff_manifest(previous_manifest, state['manifest'])
+        print('%d members changed, %d removed since version %s' % (len(changed), len(state['removed']), (previous_manifest or {}).get('VersionId')))
+        return changed
+
+    result = artifact_extract.extract_zip(s3, bucket, prefix, artifacts_zip_key, version_id, mode, context, resume, select)
+    if result is None:
+        return None
+    manifest = state['manifest']
+
+    failed_deletes = delete_members(bucket, prefix, state['removed'])
+
+    # members that failed to sync are left out of the manifest, so the next sync retries them
+    for filename in result['fail']:
+        manifest['Members'].pop(filename[len(prefix):], None)
+    if failed_deletes:
+        manifest['Members'].update({name: previous_manifest['Members'][name] for name in failed_deletes})
+    save_manifest(bucket, prefix, artifacts_zip_key, manifest)
+    result.pop('Checkpoint').clear()
+
+    if 0 == len(result['fail']) and 0 == len(failed_deletes):
         print('sucessfully extracted artifacts into bucket %s' % (bucket))
         return True
     else:
         print(result)
         return False
 
-def copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key):
-    key = prefix + artifacts_zip_key
-    copy_source = {
-        'Bucket': source_bucket,
-        'Key': key
-    }
-    print('copy_source: %s' % copy_source)
-    print('dest_bucket = %s'% dest_bucket)
-    print('key = %s' % key)
-    response = s3.copy_object(CopySource=copy_source, Bucket=dest_bucket, Key=key)
-    print(response)
-    if 'VersionId' in response:
-        print('successfully downloaded mcafee artifacts zip from bucket %s' % (source_bucket))
-        return extract_zip(dest_bucket, prefix, artifacts_zip_key)
-    else:
-        print("artifacts zip is not copied into regional S3 bucket")
+def copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key, mode=artifact_extract.EXTRACT_MODE_STREAM, context=None):
+    version_id = artifact_extract.copy_archive(s3, source_bucket, dest_bucket, prefix + artifacts_zip_key)
+    if version_id is None:
         return False
+    return extract_zip(dest_bucket, prefix, artifacts_zip_key, version_id, mode, context)
 
 def get_parameter_from_parameter_store(param):
     try:
@@ -84,7 +111,9 @@ def update_parameter(name, description, value):
         print('Failed to update artifacts version ID in parameter store, %s', (str(e)))
 
 
-def is_version_changed(source_bucket, prefix, artifacts_zip_key, artifacts_version_id_param):
+def get_changed_version_id(source_bucket, prefix, artifacts_zip_key, artifacts_version_id_param):
+    # returns the version id of the source archive when it differs from the last synced one.
+    # The parameter is only updated once that version is synced, see record_version_id
     key = prefix + artifacts_zip_key
     response = s3.head_object(Bucket=source_bucket, Key=key)
     print(response)
@@ -95,17 +124,19 @@ def is_version_changed(source_bucket, prefix, artifacts_zip_key, artifacts_versi
         print(prev_version_id)
         if "0" == prev_version_id:
             prev_version_id = cur_version_id
-            update_parameter(artifacts_version_id_param, "QS S3 Artifacts zip version ID.", cur_version_id)
+            record_version_id(artifacts_version_id_param, cur_version_id)
 
         if cur_version_id != prev_version_id:
-            update_parameter(artifacts_version_id_param, "QS S3 Artifacts zip version ID.", cur_version_id)
-            return True
+            return cur_version_id
         else:
-            return False
+            return None
     else:
         print('There is no version on key %s' % artifacts_zip_key)
         return None
 
+def record_version_id(artifacts_version_id_param, version_id):
+    update_parameter(artifacts_version_id_param, "QS S3 Artifacts zip version ID.", version_id)
+
 def handler(event, context):
   print('Received event: %s' % json.dumps(event))
   try:
@@ -114,11 +145,27 @@ def handler(event, context):
       artifacts_zip_key = event["ArtifactsZIPKey"]
       artifacts_version_id_param = event['ArtifactsVersionIDSSMParameter']
       prefix = event["Prefix"]
+      extract_mode = event.get('ExtractMode', artifact_extract.EXTRACT_MODE_STREAM)
 
-      if True == is_version_changed(source_bucket, prefix, artifacts_zip_key, artifacts_version_id_param):
-          copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key)
+      # a continuation resumes the extraction of the version found by the first invocation
+      if 0 != continuation.get_continuation_count(event):
+          state = continuation.get_continuation_state(event)
+          synced = extract_zip(dest_bucket, prefix, artifacts_zip_key, None, extract_mode, context, resume=True)
+      else:
+          state = {'SourceVersionId': get_changed_version_id(source_bucket, prefix, artifacts_zip_key, artifacts_version_id_param)}
+          if state['SourceVersionId'] is None:
+              print("There is no change in quick start artifacts")
+              return
+          synced = copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key, extract_mode, context)
+
+      if None == synced:
+          continuation.invoke_continuation(lambda_client, event, context, state)
+      elif True == synced:
+          # only a complete sync moves the recorded version on, otherwise the next run syncs again
+          # and retries the members left out of the manifest
+          record_version_id(artifacts_version_id_param, state['SourceVersionId'])
       else:
-          print("There is no change in quick start artifacts")
+          print('failed to sync the quick start artifacts, version %s is synced again on the next run' % state['SourceVersionId'])
 
   except Exception as e:
       print('Exception in handling the artifacts syncup event, %s' % (str(e)))
@@ -1,19 +1,17 @@
 #!/usr/bin/env python3
 import json
-import boto3
-import cfnresponse
 
-r53 = boto3.client('route53')
-cfn = boto3.client('cloudformation')
+import aws_clients
+import cfn_response
+import hosted_zones
+import stack_metadata
+
+r53 = aws_clients.client('route53')
+cfn = aws_clients.client('cloudformation')
 
 def is_route53_domain_exist(domain_name):
     try:
-        response = r53.get_hosted_zone_count()
-        if '0' != response['HostedZoneCount']:
-            response = r53.list_hosted_zones_by_name(DNSName=domain_name)
-            if domain_name == response['HostedZones'][0]['Name']:
-                return True
-        return False
+        return hosted_zones.get_zone_index(r53).exists(domain_name)
     except Exception as e:
         print(str(e))
 
@@ -38,45 +36,43 @@ def get_hosted_zone_id(user_data, response):
         domain_name = user_data['DomainName']
         response['HostedZoneId'] = ''
         if '' != domain_name:
-            result = r53.list_hosted_zones_by_name(DNSName=domain_name)
-            response['HostedZoneId'] = result['HostedZones'][0]['Id'].split('/')[2]
+            # the zone of the domain or of its closest parent domain
+            response['HostedZoneId'] = hosted_zones.get_zone_index(r53).get_zone_id(domain_name) or ''
         print(response)
         return response
     except Exception as e:
         print(str(e))
 
 def check_stack_details(user_data, response):
-    result = cfn.describe_stacks(StackName=user_data['StackName'])
-    if 'Stacks'  in result:
-        if 'RootId' in result['Stacks'][0]:
-            root_stack_id = result['Stacks'][0]['RootId']
-            root_stack_name = root_stack_id.split('/')[1]
-            response['ParentStack'] = root_stack_name
-            response['ParentStackID'] = root_stack_id
-        else:
-            response['ParentStack'] = user_data['StackName']
-            response['ParentStackID'] = result['Stacks'][0]['StackId']
-        return response
-    return False
+    metadata = stack_metadata.get_stack_metadata(cfn, user_data['StackName'])
+    if 'RootId' in metadata['Stack']:
+        root_stack_id = metadata['Stack']['RootId']
+        root_stack_name = root_stack_id.split('/')[1]
+        response['ParentStack'] = root_stack_name
+        response['ParentStackID'] = root_stack_id
+    else:
+        response['ParentStack'] = user_data['StackName']
+        response['ParentStackID'] = metadata['Stack']['StackId']
+    return response
 
 def handler(event, context):
     print('Received event: %s' % json.dumps(event))
     try:
         user_data = event.get('ResourceProperties')
-        status = cfnresponse.SUCCESS
+        status = cfn_response.SUCCESS
         response = {}
         request_type = event['RequestType']
         if request_type != 'Delete':
             if False == check_parameter_details(request_type, user_data):
-                status = cfnresponse.FAILED
+                status = cfn_response.FAILED
             else:
                 response = get_hosted_zone_id(user_data, response)
                 print(response)
                 response = check_stack_details(user_data, response)
                 print(response)
                 if False == response:
-                    status = cfnresponse.FAILED
-        cfnresponse.send(event, context, status, response, None)
+                    status = cfn_response.FAILED
+        cfn_response.send(event, context, status, response, None)
     except Exception as e:
         print('Exception in handling the request, %s' % (str(e)))
-        cfnresponse.send(event, context, cfnresponse.FAILED, {}, None)
+        cfn_response.send(event, context, cfn_response.FAILED, {}, None)
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
-import boto3
-import http.client
-import urllib
 import json
+import os
+import time
 import uuid
 
-s3 = boto3.resource('s3')
+
+import aws_clients
+import bucket_purge
+import cfn_response
+import continuation
+
+s3 = aws_clients.resource('s3')
+# one connection per lister and delete worker
+s3_client = aws_clients.client('s3', max_pool_connections=bucket_purge.DEFAULT_LIST_WORKERS + bucket_purge.DEFAULT_DELETE_WORKERS)
+lambda_client = aws_clients.client('lambda')
+
+# cloudformation waits an hour for a custom resource, answer before that even if buckets are left
+PURGE_DEADLINE_SECONDS = int(os.environ.get('PURGE_DEADLINE_MINUTES', '50')) * 60
+# the deadline bounds the purge, the count only guards against a runaway chain of invocations
+MAX_PURGE_CONTINUATIONS = 100
 
 def handler(event, context):
     response = {
@@ -23,36 +36,43 @@ def handler(event, context):
         bucket_names = event['ResourceProperties']['BucketNames']
         if event['RequestType'] == 'Delete':
             print(bucket_names)
-            for bucket_name in bucket_names:
-                bucket = s3.Bucket(bucket_name)
-                print('deleting data from bucket %s' % bucket_name)
-                bucket.objects.all().delete()
-                print('deleting all versions of bucket %s' % bucket_name)
-                bucket.object_versions.all().delete()
-                if 'DeleteBucket' in event['ResourceProperties']:
+            if not purge(event, context, bucket_names):
+                # a continuation carries on with the purge and answers cloudformation
+                return
+            if 'DeleteBucket' in event['ResourceProperties']:
+                for bucket_name in bucket_names:
                     print('deleting bucket %s' % bucket_name)
-                    bucket.delete()
+                    s3.Bucket(bucket_name).delete()
             
-        send_response(event, response, status='SUCCESS', reason="Successfully cleanup data")
+        cfn_response.send_response(event, response, status='SUCCESS', reason="Successfully cleanup data")
     except Exception as e:
         print(str(e))
         reason_str = "Failed to cleanup data, error: " + str(e)
-        return send_response(event, response, status='FAILED', reason=reason_str)
+        return cfn_response.send_response(event, response, status='FAILED', reason=reason_str)
 
 
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
+def purge(event, context, bucket_names):
+    # purges the buckets until they are empty or the lambda is about to time out, in that case
+    # the purge continues in a new invocation from the saved listing positions and False is returned
+    state = continuation.get_continuation_state(event)
+    started = state.get('Started', time.time())
+    shards = state['Shards'] if 'Shards' in state else bucket_purge.initial_shards(bucket_names)
+    has_time = continuation.time_guard(context)
+    deadline = started + PURGE_DEADLINE_SECONDS
 
-    if reason is not None:
-        response['Reason'] = reason
+    purger = bucket_purge.BucketPurger(s3_client)
+    remaining = purger.purge(shards, lambda: has_time() and time.time() < deadline)
+    deleted = state.get('Deleted', 0) + purger.deleted
+    errors = state.get('Errors', 0) + purger.errors
+    print('%d objects deleted, %d errors, %d shards left after %.0fs' % (deleted, errors, len(remaining), time.time() - started))
 
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+    if remaining:
+        if time.time() >= deadline:
+            raise Exception('buckets not empty after %d minutes, %d objects deleted' % (PURGE_DEADLINE_SECONDS // 60, deleted))
+        continuation.invoke_continuation(lambda_client, event, context,
+                                         {'Started': started, 'Shards': remaining, 'Deleted': deleted, 'Errors': errors},
+                                         MAX_PURGE_CONTINUATIONS)
+        return False
+    if errors:
+        raise Exception('failed to delete %d objects' % errors)
+    return True
@@ -1,44 +1,23 @@
 #!/usr/bin/env python3
 import json
-import boto3
-import cfnresponse
 
-import os
-import tempfile
-import zipfile
+import artifact_extract
+import aws_clients
+import cfn_response
+import continuation
+import upload_scheduler
 
-from concurrent import futures
-from io import BytesIO
+# one connection per extract upload worker
+s3 = aws_clients.client('s3', max_pool_connections=upload_scheduler.get_env_int('EXTRACT_MAX_WORKERS', upload_scheduler.DEFAULT_MAX_WORKERS))
+s3_resource = aws_clients.resource('s3')
+lambda_client = aws_clients.client('lambda')
 
-s3 = boto3.client('s3')
-s3_resource = boto3.resource('s3')
-
-def extract(bucket, prefix, filename):
-    exract_status = 'success'
-    try:
-        s3.upload_fileobj(BytesIO(zipdata.read(filename)), bucket, prefix + filename)
-    except Exception as e:
-        print('failed to extract file:%s, %s' % (prefix + filename, str(e)))
-        exract_status = 'fail'
-    finally:
-        return prefix + filename, exract_status
-
-def extract_zip(bucket, prefix, artifacts_zip_key):
-    global zipdata
-    temp_file = tempfile.mktemp()
-    s3.download_file(bucket, prefix + artifacts_zip_key, temp_file)
-    zipdata = zipfile.ZipFile(temp_file)
-
-    with futures.ThreadPoolExecutor(max_workers=4) as executor:
-        future_list = [
-            executor.submit(extract, bucket, prefix, filename)
-            for filename in zipdata.namelist()
-        ]
-
-    result = {'success': [], 'fail': []}
-    for future in future_list:
-        filename, status = future.result()
-        result[status].append(filename)
+def extract_zip(bucket, prefix, artifacts_zip_key, version_id=None, mode=artifact_extract.EXTRACT_MODE_STREAM, context=None, resume=False):
+    # returns None when the lambda deadline is near, the progress is then saved in the checkpoint
+    result = artifact_extract.extract_zip(s3, bucket, prefix, artifacts_zip_key, version_id, mode, context, resume)
+    if result is None:
+        return None
+    result.pop('Checkpoint').clear()
 
     if 0 == len(result['fail']):
         print('sucessfully extracted artifacts into bucket %s' % (bucket))
@@ -47,23 +26,11 @@ def extract_zip(bucket, prefix, artifacts_zip_key):
         print(result)
         return False
 
-def copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key):
-    key = prefix + artifacts_zip_key
-    copy_source = {
-        'Bucket': source_bucket,
-        'Key': key
-    }
-    print('copy_source: %s' % copy_source)
-    print('dest_bucket = %s'% dest_bucket)
-    print('key = %s' % key)
-    response = s3.copy_object(CopySource=copy_source, Bucket=dest_bucket, Key=key)
-    print(response)
-    if 'VersionId' in response:
-        print('successfully downloaded mcafee artifacts zip from bucket %s' % (source_bucket))
-        return extract_zip(dest_bucket, prefix, artifacts_zip_key)
-    else:
-        print('artifacts zip is not copied into regional S3 bucket')
+def copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key, mode=artifact_extract.EXTRACT_MODE_STREAM, context=None):
+    version_id = artifact_extract.copy_archive(s3, source_bucket, dest_bucket, prefix + artifacts_zip_key)
+    if version_id is None:
         return False
+    return extract_zip(dest_bucket, prefix, artifacts_zip_key, version_id, mode, context)
 
 def delete_objects(bucket_name):
     print('deleting data from bucket %s' % bucket_name)
@@ -80,17 +47,26 @@ def handler(event, context):
         dest_bucket = event['ResourceProperties']['DestBucket']
         artifacts_zip_key = event['ResourceProperties']['ArtifactsZIPKey']
         prefix = event['ResourceProperties']['Prefix']
+        extract_mode = event['ResourceProperties'].get('ExtractMode', artifact_extract.EXTRACT_MODE_STREAM)
 
         if event['RequestType'] == 'Delete':
             delete_objects(dest_bucket)
-            cfnresponse.send(event, context, cfnresponse.SUCCESS, {}, None)
+            cfn_response.send(event, context, cfn_response.SUCCESS, {}, None)
         else:
-            print('sync-up with quick start bucket due version mismatch')
-            if True == copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key):
-                cfnresponse.send(event, context, cfnresponse.SUCCESS, {}, None)
+            if 0 != continuation.get_continuation_count(event):
+                status = extract_zip(dest_bucket, prefix, artifacts_zip_key, None, extract_mode, context, resume=True)
+            else:
+                print('sync-up with quick start bucket due version mismatch')
+                status = copy_source(source_bucket, dest_bucket, prefix, artifacts_zip_key, extract_mode, context)
+
+            # the last invocation of the extraction responds to cloudformation
+            if None == status:
+                continuation.invoke_continuation(lambda_client, event, context)
+            elif True == status:
+                cfn_response.send(event, context, cfn_response.SUCCESS, {}, None)
             else:
-                cfnresponse.send(event, context, cfnresponse.FAILED, {}, None)
+                cfn_response.send(event, context, cfn_response.FAILED, {}, None)
 
     except Exception as e:
         print('Exception in handling the request, %s' % (str(e)))
-        cfnresponse.send(event, context, cfnresponse.FAILED, {}, None)
+        cfn_response.send(event, context, cfn_response.FAILED, {}, None)
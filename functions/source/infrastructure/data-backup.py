@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
-import boto3
 import os
 import datetime
 
-cw_logs = boto3.client('logs')
+import aws_clients
+
+cw_logs = aws_clients.client('logs')
 
 def handler(event, context):
     try:
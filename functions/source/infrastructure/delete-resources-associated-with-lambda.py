@@ -3,14 +3,14 @@
 # Returns: Error or status message
 #
 # deletes the resources assocated with lambda like eni
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 import threading
 from time import sleep
 
+import aws_clients
+import cfn_response
+
 def handler(event, context):
     print(event)
     response = {
@@ -29,7 +29,7 @@ def handler(event, context):
         if event['RequestType'] == 'Delete':
             user_data = event['ResourceProperties']
             # setup ec2 client
-            ec2client = boto3.client('ec2')
+            ec2client = aws_clients.get_client('ec2')
 
             # loop through all ENI's in the Security Group send by CloudFormation
             enis = ec2client.describe_network_interfaces(Filters=[{'Name': 'group-id','Values': [user_data['SecurityGroup']]}])
@@ -54,26 +54,9 @@ def handler(event, context):
                         print('Deleting ENI %s' % eni['NetworkInterfaceId'])
                         ec2client.delete_network_interface(NetworkInterfaceId=eni['NetworkInterfaceId'])
 
-            return send_response(event, response, status='SUCCESS', reason='Successfully deleted the resources associated with lambda')
+            return cfn_response.send_response(event, response, status='SUCCESS', reason='Successfully deleted the resources associated with lambda')
         else:
-            return send_response(event, response, status='SUCCESS', reason="Nothing to do for request type other than delete")
+            return cfn_response.send_response(event, response, status='SUCCESS', reason="Nothing to do for request type other than delete")
     except Exception as e:
         print(str(e))
-        return send_response(event, response, status='SUCCESS', reason="Failed to delete resources associated with lambda")
-
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+        return cfn_response.send_response(event, response, status='SUCCESS', reason="Failed to delete resources associated with lambda")
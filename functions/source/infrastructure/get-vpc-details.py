@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 
-ec2 = boto3.client('ec2')
+import aws_clients
+import cfn_response
+
+ec2 = aws_clients.client('ec2')
 
 
 def attach_stack_vpc_details(vpc_id, private_subnet1, private_subnet2, public_subnet1, public_subnet2, response):
@@ -41,7 +41,7 @@ def attach_stack_vpc_details(vpc_id, private_subnet1, private_subnet2, public_su
     return response
 
 def attach_db_vpc_details(db_identifier, response):
-    rds = boto3.client('rds')
+    rds = aws_clients.get_client('rds')
     rds_response = rds.describe_db_instances(DBInstanceIdentifier=db_identifier)
     db_instances = rds_response['DBInstances']
     if len(db_instances) != 1:
@@ -80,7 +80,7 @@ def handler(event, context):
 
     try:
         if event['RequestType'] == 'Delete':
-            return send_response(event,response, status='SUCCESS', reason="")
+            return cfn_response.send_response(event,response, status='SUCCESS', reason="")
         elif event['RequestType'] == 'Update' or event['RequestType'] == 'Create':
             props = event.get('ResourceProperties')
             try:
@@ -97,31 +97,13 @@ def handler(event, context):
                     response = attach_stack_vpc_details(vpc_id, private_subnet1, private_subnet2, public_subnet1, public_subnet2,response)
 
                 print(response)
-                return send_response(event, response, status='SUCCESS', reason="Successfully got details of vpc")
+                return cfn_response.send_response(event, response, status='SUCCESS', reason="Successfully got details of vpc")
             except Exception as e:
                 print(response)
                 print(str(e))
-                return send_response(event, response, status='FAILED', reason="Failed to get details of vpc")
+                return cfn_response.send_response(event, response, status='FAILED', reason="Failed to get details of vpc")
         else:
-            return send_response(event, response, status='FAILED', reason="Invalid request type")
+            return cfn_response.send_response(event, response, status='FAILED', reason="Invalid request type")
     except Exception as e:
         print(str(e))
-        return send_response(event, response, status='FAILED', reason="Failed to get vpc details.")
-
-
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+        return cfn_response.send_response(event, response, status='FAILED', reason="Failed to get vpc details.")
@@ -3,18 +3,25 @@
 # Returns: Error or status message
 #
 # sends the post deployment email and attaches the ePO local agent handler  instance to the AH ASG
-import boto3
-import http.client
-import urllib
 import json
+import time
 import uuid
 import re
 from botocore.exceptions import ClientError
-from base64 import b64encode
-import ssl
+from concurrent import futures
 
-rg_client = boto3.client('resource-groups')
-ssm = boto3.client('ssm')
+import asset_cache
+import aws_clients
+import cfn_response
+import epo_remote
+import parameter_cache
+import parameter_store
+import ses_routing
+
+rg_client = aws_clients.client('resource-groups')
+ssm = aws_clients.client('ssm')
+parameters = parameter_cache.ParameterCache(ssm)
+assets = asset_cache.AssetCache(aws_clients.client('s3'))
 
 def validate_email_params(user_data, email_data):
     if 'StackURL' not in user_data:
@@ -42,15 +49,12 @@ def validate_email_params(user_data, email_data):
 
 
 def download_message(user_data, email_data):
-    s3 = boto3.client('s3')
-
+    # unchanged assets are revalidated with a conditional GET instead of downloaded again
     key = email_data['Prefix'] + email_data['HTMLEmailSourceKey']
-    response = s3.get_object(Bucket=email_data['SourceBucket'], Key=key)
-    message = response['Body'].read().decode('utf-8')
+    message, etag = assets.get_text(email_data['SourceBucket'], key)
 
     key = email_data['Prefix'] + email_data['ComponentsJSONFile']
-    response = s3.get_object(Bucket=email_data['SourceBucket'], Key=key)
-    components = json.loads(response['Body'].read().decode('utf-8'))
+    components = assets.get_json(email_data['SourceBucket'], key)
 
     message = re.sub('@url.epo.console@', user_data['EPOConsoleURL'], message)
     message = re.sub('@url.mcafee.stack@', user_data['StackURL'], message)
@@ -60,7 +64,7 @@ def download_message(user_data, email_data):
 
     for key in components:
         # Store the base build version number used at the time of stack creation.
-        ssm.put_parameter(Name=parameter_store_identifier+'/buildinfo/'+key,Description=components[key]['Name']+' version',Value=components[key]['BuildVersion'],Type='String', Overwrite=True)
+        parameters.put(parameter_store_identifier+'/buildinfo/'+key, components[key]['BuildVersion'], 'String', components[key]['Name']+' version')
         message = re.sub("@"+key.lower()+".buildversion@", components[key]['BuildVersion'], message)
 
     print(components)
@@ -70,22 +74,15 @@ def download_message(user_data, email_data):
         print(user_data['PipeLineURL'])
     return message
 
-def delete_parameter(name):
+def delete_ssm_parameters(user_data):
+    # the build info is found under its path, the components file in S3 may already be gone
     # even delete fails dont pass the exception
+    path = user_data['ParameterStoreIdentifier'] + '/buildinfo'
     try:
-        ssm.delete_parameter(Name=name)
+        names = parameter_store.list_parameter_names(ssm, path)
+        parameters.delete_all(names, parameter_store.ParameterWriter())
     except Exception as e:
-        str(e)
-
-def delete_ssm_parameters(user_data, email_data):
-    s3 = boto3.client('s3')
-    key = email_data['Prefix'] + email_data['ComponentsJSONFile']
-    response = s3.get_object(Bucket=email_data['SourceBucket'], Key=key)
-    components = json.loads(response['Body'].read().decode('utf-8'))
-    parameter_store_identifier = user_data['ParameterStoreIdentifier']
-
-    for key in components:
-        delete_parameter(parameter_store_identifier+'/buildinfo/'+key)
+        print('failed to delete parameters under %s, %s' % (path, str(e)))
 
 def get_email_address_list(email_address):
     email_address_list = []
@@ -95,9 +92,8 @@ def get_email_address_list(email_address):
 
 def send_email(sender_address, to_addresses, cc_addresses, subject, message):
     charset = 'UTF-8'
-    ses = boto3.client('ses', region_name='us-west-2')
 
-    response = ses.send_email(
+    response = ses_routing.call('send_email',
         Destination={
             'ToAddresses': get_email_address_list(to_addresses),
             'CcAddresses': get_email_address_list(cc_addresses),
@@ -129,30 +125,12 @@ def email_handler(user_data, request_type):
             message = download_message(user_data, email_data)
             send_email(email_data['SenderEmailAddress'], email_data['ToEmailAddresses'], email_data['CcEmailAddress'], subject, message)
         elif request_type == 'Delete':
-            delete_ssm_parameters(user_data, email_data)
+            delete_ssm_parameters(user_data)
 
     except Exception as e:
         print('failed to send email to reciepents')
         print(str(e))
 
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
-
-
 def get_resource_group(rg_name):
     try:
         response = rg_client.get_group(GroupName=rg_name)
@@ -205,38 +183,22 @@ def remote_command_handler(user_data, request_type):
                 ah_elb_url = user_data['AHELBURL']
 
             parameter_store_identifier = user_data['ParameterStoreIdentifier']
-            response = ssm.get_parameter(Name=parameter_store_identifier+'/EPOAdminUserName')
-            epo_username = response['Parameter']['Value']
-            response = ssm.get_parameter(Name=parameter_store_identifier+'/EPOAdminPassword', WithDecryption=True)
-            epo_password = response['Parameter']['Value']
+            epo_username = parameters.get(parameter_store_identifier+'/EPOAdminUserName')
+            epo_password = parameters.get(parameter_store_identifier+'/EPOAdminPassword', decrypt=True)
 
             epo_hostname = cmd_data['EPOURL']
             epo_port = cmd_data['EPOConsolePort']
 
-            auth_string = epo_username + ':' + epo_password
-            auth = b64encode(auth_string.encode()).decode("ascii")
-            headers = { 'Authorization' : 'Basic %s' %  auth }
+            epo = epo_remote.EPOClient(epo_hostname, epo_port, epo_username, epo_password)
 
             # Remote command to set AH virtual group
-            ah_remote_cmd_path = '/remote/AgentMgmt.createAgentHandlerGroup?groupName=' + group_name + '&enabled=true&loadBalancerSet=true&virtualIP=' + ah_url + '&virtualDNSName=' + ah_elb_url + '&virtualNetBiosName=' + ah_url
-            https = http.client.HTTPSConnection(epo_hostname, epo_port, context=ssl._create_unverified_context())
-            https.request('POST', ah_remote_cmd_path, headers=headers)
-            response = https.getresponse()
-            print(response.status, response.reason)
+            print(epo.call('AgentMgmt.createAgentHandlerGroup', groupName=group_name, enabled='true', loadBalancerSet='true', virtualIP=ah_url, virtualDNSName=ah_elb_url, virtualNetBiosName=ah_url))
 
             # Remote command to set DXL loadbalancer info
-            dxl_remote_cmd_path = '/remote/DxlBrokerMgmt.setLoadBalancerInfo?dnsName=' + dxl_elb_url + '&ipAddress=' + dxl_elb_url + '&port=' + dxl_port
-            https = http.client.HTTPSConnection(epo_hostname, epo_port, context=ssl._create_unverified_context())
-            https.request('POST', dxl_remote_cmd_path, headers=headers)
-            response = https.getresponse()
-            print(response.status, response.reason)
+            print(epo.call('DxlBrokerMgmt.setLoadBalancerInfo', dnsName=dxl_elb_url, ipAddress=dxl_elb_url, port=dxl_port))
 
             # Remote command to set ePO DNS name for Agent deployment url
-            epo_remote_cmd_path = '/remote/EPOCore.setAgentDeploymentURLServerCmd?agentDeploymentURLServer=' + epo_dns_name
-            https = http.client.HTTPSConnection(epo_hostname, epo_port, context=ssl._create_unverified_context())
-            https.request('POST', epo_remote_cmd_path, headers=headers)
-            response = https.getresponse()
-            print(response.status, response.reason)
+            print(epo.call('EPOCore.setAgentDeploymentURLServerCmd', agentDeploymentURLServer=epo_dns_name))
 
         elif request_type == 'Delete' or request_type == 'Update':
             print('nothing to do for remote command handler in case of update or delete request type')
@@ -247,7 +209,7 @@ def remote_command_handler(user_data, request_type):
 
 # Register Local AgentHandler with  AgentHandler's LoadBalancer
 def localah_registration_handler(user_data, request_type):
-    elb_client = boto3.client('elb')
+    elb_client = aws_clients.get_client('elb')
     ah_loadbalancer_id = user_data['LocalAHRegistrationHandlerData']['AHELBName']
     epo_instance_id = user_data['LocalAHRegistrationHandlerData']['EPOInstanceID']
     print('Performing action %s with ePOInstanceId %s and AHELBName %s' %(request_type, epo_instance_id, ah_loadbalancer_id))
@@ -266,6 +228,76 @@ def localah_registration_handler(user_data, request_type):
     else:
         print('Unknown request type for localah_registration_handler')
 
+# the sub handlers run for the user data entries present, they touch unrelated services
+SUB_HANDLERS = [
+    ('RemoteCommandHandlerData', remote_command_handler),
+    ('ResourceGroupHandlerData', resource_group_handler),
+    ('LocalAHRegistrationHandlerData', localah_registration_handler)
+]
+# run after the others and only when none of them failed, the welcome mail is only sent for a
+# working deployment
+FINAL_SUB_HANDLERS = [
+    ('EmailHandlerData', email_handler)
+]
+# time kept after the sub handlers to send the response
+RESPONSE_RESERVE_MILLIS = 30 * 1000
+
+def run_concurrently(sub_handlers, user_data, request_type, deadline, results, failed):
+    # runs the sub handlers concurrently until the deadline, adds their results by name and the
+    # names of those failing the resource: sub handlers running out of time or raising anything
+    # but a ClientError. Returns False when a sub handler ran out of time
+    selected = [(key, sub_handler) for key, sub_handler in sub_handlers if key in user_data]
+    if not selected:
+        return True
+    timeout = max(0, deadline - time.time()) if deadline is not None else None
+    executor = futures.ThreadPoolExecutor(max_workers=len(selected))
+    pending = dict((executor.submit(sub_handler, user_data, request_type), sub_handler.__name__) for key, sub_handler in selected)
+    done, not_done = futures.wait(pending, timeout=timeout)
+    for future in done:
+        name = pending[future]
+        try:
+            future.result()
+            results[name] = 'OK'
+        except Exception as e:
+            print('%s failed, %s' % (name, str(e)))
+            results[name] = ('failed: %s' % str(e))[:256]
+            if not isinstance(e, ClientError):
+                failed.append(name)
+    for future in not_done:
+        name = pending[future]
+        print('%s did not finish in %.0fs' % (name, timeout))
+        results[name] = 'timed out'
+        failed.append(name)
+    # do not wait for sub handlers past the deadline, the response has to go out
+    executor.shutdown(wait=False)
+    return not not_done
+
+def run_sub_handlers(user_data, request_type, context):
+    # runs the sub handlers until the deadline of the invocation. Returns the result of every sub
+    # handler by name and the names of those failing the resource
+    deadline = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        deadline = time.time() + max(0, context.get_remaining_time_in_millis() - RESPONSE_RESERVE_MILLIS) / 1000.0
+
+    results = {}
+    failed = []
+    start = time.time()
+    finished = run_concurrently(SUB_HANDLERS, user_data, request_type, deadline, results, failed)
+    if failed:
+        for key, sub_handler in FINAL_SUB_HANDLERS:
+            if key in user_data:
+                print('skipping %s, %s failed' % (sub_handler.__name__, ', '.join(failed)))
+                results[sub_handler.__name__] = 'skipped'
+    else:
+        finished = run_concurrently(FINAL_SUB_HANDLERS, user_data, request_type, deadline, results, failed)
+    if not finished:
+        # a timed out sub handler must not send ePO commands any longer, not even in the next
+        # invocation of this container
+        epo_remote.close_all()
+    if results:
+        print('sub handlers finished in %.2fs, %s' % (time.time() - start, json.dumps(results)))
+    return results, sorted(failed)
+
 def handler(event, context):
     print(event)
     response = {
@@ -285,15 +317,16 @@ def handler(event, context):
         user_data = event['ResourceProperties']
         request_type = event['RequestType']
 
-        if 'RemoteCommandHandlerData' in user_data:
-            remote_command_handler(user_data, request_type)
-        if 'EmailHandlerData' in user_data:
-            email_handler(user_data, request_type)
-        if 'ResourceGroupHandlerData' in user_data:
-            resource_group_handler(user_data, request_type)
-        if 'LocalAHRegistrationHandlerData' in user_data:
-            localah_registration_handler(user_data,request_type)
-        return send_response(event, response, status='SUCCESS', reason="succesfully applied post deployment actions")
+        results, failed = run_sub_handlers(user_data, request_type, context)
+        response['Data'] = results
+        if failed:
+            return cfn_response.send_response(event, response, status='FAILED', reason='failed to apply post deployment actions: %s' % ', '.join(failed))
+        if any('OK' != result for result in results.values()):
+            return cfn_response.send_response(event, response, status='SUCCESS', reason="Was not able to apply post deployment actions")
+        return cfn_response.send_response(event, response, status='SUCCESS', reason="succesfully applied post deployment actions")
     except ClientError as e:
         print(str(e))
-        return send_response(event, response, status='SUCCESS', reason="Was not able to apply post deployment actions")
+        return cfn_response.send_response(event, response, status='SUCCESS', reason="Was not able to apply post deployment actions")
+    except Exception as e:
+        print(str(e))
+        return cfn_response.send_response(event, response, status='FAILED', reason="Failed to apply post deployment actions, error: " + str(e))
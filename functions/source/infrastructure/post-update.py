@@ -5,15 +5,22 @@
 # sends an update email to the user
 # This should always callback to the CodePipeline API to indicate success or failure
 
-import boto3
 import os
 import zipfile
 import json
 import uuid
-from botocore.client import Config
 import re
 
-code_pipeline = boto3.client('codepipeline')
+import asset_cache
+import aws_clients
+import parameter_cache
+import parameter_store
+import ses_routing
+
+code_pipeline = aws_clients.client('codepipeline')
+ssm = aws_clients.client('ssm')
+parameters = parameter_cache.ParameterCache(ssm)
+assets = asset_cache.AssetCache(aws_clients.client('s3'))
 
 def put_job_success(job_id, message):
     print('Putting job success')
@@ -46,32 +53,42 @@ def get_user_data(job_data):
     return user_data
 
 def download_message(user_data):
-    s3 = boto3.client('s3')
-
+    # unchanged assets are revalidated with a conditional GET instead of downloaded again
     key = user_data['Prefix'] + user_data['HTMLEmailSourceKey']
-    response = s3.get_object(Bucket=user_data['SourceBucket'], Key=key)
-    message = response['Body'].read().decode('utf-8')
+    message, etag = assets.get_text(user_data['SourceBucket'], key)
 
     key = user_data['Prefix'] + user_data['ComponentsJSONFile']
-    response = s3.get_object(Bucket=user_data['SourceBucket'], Key=key)
-    components = json.loads(response['Body'].read().decode('utf-8'))
+    components = assets.get_json(user_data['SourceBucket'], key)
 
     print(components)
-    ssm = boto3.client('ssm')
     parameter_store_identifier = user_data['ParameterStoreIdentifier']
 
-    message = re.sub('@url.mcafee.pipeline.console@', user_data['PipelineURL'], message)
+    # the previous build versions of all components in one batched read
+    names = dict((key, parameter_store_identifier+'/buildinfo/'+key) for key in components)
+    build_versions = parameters.get_many(names.values())
+
+    placeholders = {'@url.mcafee.pipeline.console@': user_data['PipelineURL']}
     for key in components:
-        response = ssm.get_parameter(Name=parameter_store_identifier+'/buildinfo/'+key)
-        print(response)
+        if names[key] not in build_versions:
+            raise Exception('build info %s not found in parameter store' % names[key])
+        print('%s build version %s' % (key, build_versions[names[key]]))
         if 'epo' != key.lower():
-            message = re.sub("@"+key.lower()+".buildversion.from@", response['Parameter']['Value'], message)
-            message = re.sub("@"+key.lower()+".buildversion.to@", components[key]['BuildVersion'], message)
+            placeholders['@'+key.lower()+'.buildversion.from@'] = build_versions[names[key]]
+            placeholders['@'+key.lower()+'.buildversion.to@'] = components[key]['BuildVersion']
+    message = replace_placeholders(message, placeholders)
 
-        ssm.put_parameter(Name=parameter_store_identifier+'/buildinfo/'+key,Description=components[key]['Name']+' version',Value=components[key]['BuildVersion'],Type='String', Overwrite=True)
+    # store the new build versions, the writes overlap
+    build_info = [{'Name': names[key], 'Value': components[key]['BuildVersion'], 'Type': 'String', 'Description': components[key]['Name']+' version'}
+                  for key in components]
+    parameters.put_all(build_info, parameter_store.ParameterWriter())
 
     return message
 
+def replace_placeholders(message, placeholders):
+    # replaces all placeholders in a single pass over the message
+    pattern = re.compile('|'.join(re.escape(placeholder) for placeholder in placeholders))
+    return pattern.sub(lambda match: placeholders[match.group(0)], message)
+
 def get_email_address_list(email_address):
     email_address_list = []
     if email_address: # if email_address is not empty string or empty list
@@ -80,8 +97,7 @@ def get_email_address_list(email_address):
 
 def send_email(sender_address, to_addresses, cc_addresses, subject, message):
     charset = 'UTF-8'
-    ses = boto3.client('ses', region_name='us-west-2')
-    response = ses.send_email(
+    response = ses_routing.call('send_email',
         Destination={
             'ToAddresses': get_email_address_list(to_addresses),
             'CcAddresses': get_email_address_list(cc_addresses),
@@ -111,10 +127,9 @@ def email_handler(job_data):
         user_data = get_user_data(job_data)
 
         # If PipelineExecutionVersion is 0 which means the pipeline updated for the firsttime immediately after creation of stack, so no need to send update email.
-        ssm = boto3.client('ssm')
+        # setup-artifacts bumps the version earlier in the same pipeline run
         parameter_store_identifier = user_data['ParameterStoreIdentifier']
-        response = ssm.get_parameter(Name=parameter_store_identifier+'/PipelineExecutionVersion')
-        pipelineExecutionVersion = int(response['Parameter']['Value'])
+        pipelineExecutionVersion = int(parameters.get(parameter_store_identifier+'/PipelineExecutionVersion', fresh=True))
         print('PipelineExecutionVersion is : '+str(pipelineExecutionVersion))
 
         if pipelineExecutionVersion > 1:
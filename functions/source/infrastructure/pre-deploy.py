@@ -3,15 +3,19 @@
 # Returns: Error or status message
 #
 # setups the parameter store with required fields, verifies the email address
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 import copy
 from botocore.exceptions import ClientError
 
-ssm = boto3.client('ssm')
+import aws_clients
+import cfn_response
+import parameter_store
+import ses_routing
+import stack_metadata
+
+ssm = aws_clients.client('ssm')
+cfn = aws_clients.client('cloudformation')
 
 def validate_user_data_for_parameter_store(user_data):
     if 'ParameterStoreIdentifier' not in user_data:
@@ -30,53 +34,58 @@ def add_stack_parameters(stack, stack_parameters):
     return stack_parameters
 
 def get_stack_parameters(stack_name):
-    client = boto3.client('cloudformation')
-    result = client.describe_stacks(StackName=stack_name)
+    # the stack and its root come from the shared stack metadata lookup
+    metadata = stack_metadata.get_stack_metadata(cfn, stack_name)
     # convert them into proper formatting we want
-    stack_parameters = {}
-    if 'Stacks'  in result:
-        stack_parameters = add_stack_parameters(result['Stacks'][0], stack_parameters)
-        # add root stack parameters as well for completeness
-        if 'RootId' in result['Stacks'][0]:
-            root_stack_id = result['Stacks'][0]['RootId']
-            root_stack_name = root_stack_id.split('/')[1]
-            root_stack_result = client.describe_stacks(StackName=root_stack_name)
-            if 'Stacks'  in result:
-                stack_parameters = add_stack_parameters(root_stack_result['Stacks'][0], stack_parameters)
+    stack_parameters = add_stack_parameters(metadata['Stack'], {})
+    # add root stack parameters as well for completeness
+    if metadata['Root'] is not None:
+        stack_parameters = add_stack_parameters(metadata['Root'], stack_parameters)
     return stack_parameters
 
-def update_parameter(name, description, value, type):
+def get_parameter(name, description, value, type):
     if value != '':
-        ssm.put_parameter(Name=name,Description=description,Value=value,Type=type, Overwrite=True)
-    else:
-        print(name + ' value is empty')
-
-def delete_parameter(name):
-    # even delete fails dont pass the exception
-    try:
-        ssm.delete_parameter(Name=name)
-    except Exception as e:
-        str(e)
+        return {'Name': name, 'Description': description, 'Value': value, 'Type': type}
+    print(name + ' value is empty')
+    return None
 
-def update_parameter_store(stack_parameters, user_parameters, identifier):
+def get_parameters(stack_parameters, user_parameters, identifier):
+    parameters = []
     for k, v in stack_parameters.items():
         name = identifier + '/' + k
-        update_parameter(name, '', v, 'String')
+        parameters.append(get_parameter(name, '', v, 'String'))
     for k, v in user_parameters.items():
         name = identifier + '/' + k
-        update_parameter(name, v['Description'], v['Value'], v['Type'])
-
-def delete_parameter_store(stack_parameters, user_parameters, identifier):
-    for k, v in stack_parameters.items():
-        name = identifier + '/' + k
-        delete_parameter(name)
+        parameters.append(get_parameter(name, v['Description'], v['Value'], v['Type']))
+    return [parameter for parameter in parameters if parameter is not None]
 
-    for k, v in user_parameters.items():
-        name = identifier + '/' + k
-        delete_parameter(name)
+def update_parameter_store(stack_parameters, user_parameters, identifier):
+    # written concurrently, paced below the ssm write limit
+    parameter_store.ParameterWriter().put_all(get_parameters(stack_parameters, user_parameters, identifier))
+
+def sync_parameter_store(stack_parameters, user_parameters, removed_keys, identifier):
+    # writes only the parameters that differ from the parameter store and deletes removed ones,
+    # unchanged parameters keep their version
+    parameters = get_parameters(stack_parameters, user_parameters, identifier)
+    current = parameter_store.get_parameters_by_path(ssm, identifier)
+    changed = parameter_store.get_changed_parameters(current, parameters)
+    stale = [identifier + '/' + k for k in removed_keys if identifier + '/' + k in current]
+    print('%d of %d parameters changed, %d removed' % (len(changed), len(parameters), len(stale)))
+    writer = parameter_store.ParameterWriter()
+    writer.put_all(changed)
+    writer.delete_all(stale)
+
+def delete_parameter_store(identifier):
+    # removes everything under the identifier, also what other functions stored there
+    # even delete fails dont pass the exception
+    try:
+        names = parameter_store.list_parameter_names(ssm, identifier)
+        parameter_store.ParameterWriter().delete_all(names)
+    except Exception as e:
+        print('failed to delete parameters under %s, %s' % (identifier, str(e)))
 
 # setups the parameter store
-def setup_parameter_store_handler(user_data, request_type):
+def setup_parameter_store_handler(user_data, request_type, old_user_data=None):
     print('handler parameter store started')
     validate_user_data_for_parameter_store(user_data)
     parameter_store_id = user_data['ParameterStoreIdentifier']
@@ -99,6 +108,12 @@ def setup_parameter_store_handler(user_data, request_type):
         pipeline_cfn_iam_role_arn = user_data['PipelineCloudformationIAMRoleARN']
         user_parameters['PipelineCloudformationIAMRoleARN']['Value'] = pipeline_cfn_iam_role_arn
 
+    if request_type == 'Delete':
+        # the stack parameters are not needed to tear down the identifier path
+        delete_parameter_store(parameter_store_id)
+        print('handler parameter store finished')
+        return
+
     if 'StackName'  in user_data:
         stack_parameters = get_stack_parameters(user_data['StackName'])
     else:
@@ -108,9 +123,8 @@ def setup_parameter_store_handler(user_data, request_type):
         update_parameter_store(stack_parameters, user_parameters, parameter_store_id)
     elif request_type == 'Update':
         params = exclude_parameters(stack_parameters, user_parameters)
-        update_parameter_store(params['stack_params'], params['user_params'], parameter_store_id)
-    elif request_type == 'Delete':
-        delete_parameter_store(stack_parameters, user_parameters, parameter_store_id)
+        removed_keys = get_removed_parameters(old_user_data, user_parameters, stack_parameters)
+        sync_parameter_store(params['stack_params'], params['user_params'], removed_keys, parameter_store_id)
     print('handler parameter store finished')
 
 # Some parameters should not be updated in to SSM Parameter Store when request_type is update
@@ -126,6 +140,15 @@ def exclude_parameters(stack_parameters, user_parameters):
 
     return {'user_params':user_parameters_copy, 'stack_params':stack_parameters_copy}
 
+# user parameters dropped since the previous properties, other writers share the identifier so
+# only keys this handler wrote before are considered
+def get_removed_parameters(old_user_data, user_parameters, stack_parameters):
+    if not old_user_data or 'Parameters' not in old_user_data:
+        return []
+    old_user_parameters = json.loads(old_user_data['Parameters'])
+    excluded = exclude_parameters({}, old_user_parameters)['user_params']
+    return [k for k in excluded if k not in user_parameters and k not in stack_parameters]
+
 def validate_user_data_for_email_verification(user_data):
     if 'SenderEmailAddress' not in user_data:
         raise Exception('UserData JSON must include the SenderEmailAddress')
@@ -135,14 +158,13 @@ def validate_user_data_for_email_verification(user_data):
         raise Exception('UserData JSON must include the CcEmailAddress')
 
 def verify_email_address(sender_address, to_addresses, cc_addresses):
-    ses = boto3.client('ses', region_name='us-west-2')
-    verify_email_identity(ses, sender_address)
-    verify_email_identity(ses, to_addresses)
-    verify_email_identity(ses, cc_addresses)
+    verify_email_identity(sender_address)
+    verify_email_identity(to_addresses)
+    verify_email_identity(cc_addresses)
 
-def verify_email_identity(ses, email_address):
+def verify_email_identity(email_address):
     if email_address is not None:
-        ses.verify_email_identity(EmailAddress=email_address)
+        ses_routing.call('verify_email_identity', EmailAddress=email_address)
 
 # handles the email verification
 def email_verification_handler(user_data, request_type):
@@ -173,28 +195,14 @@ def handler(event, context):
 
     try:
         user_data = event['ResourceProperties']
-        setup_parameter_store_handler(user_data, event['RequestType'])
+        setup_parameter_store_handler(user_data, event['RequestType'], event.get('OldResourceProperties'))
         if 'VerifyEmailAddress' in user_data and 'yes' == user_data['VerifyEmailAddress']:
             email_verification_handler(user_data, event['RequestType'])
-        return send_response(event, response, status='SUCCESS', reason='succesfully applied pre deployment actions')
+        return cfn_response.send_response(event, response, status='SUCCESS', reason='succesfully applied pre deployment actions')
 
     except ClientError as e:
         print(str(e))
-        return send_response(event, response, status='FAILED', reason='failed to perform pre deployment actions')
-
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print('Failed to send the response to the provdided URL')
+        return cfn_response.send_response(event, response, status='FAILED', reason='failed to perform pre deployment actions')
+    except Exception as e:
+        print(str(e))
+        return cfn_response.send_response(event, response, status='FAILED', reason='failed to perform pre deployment actions, error: ' + str(e))
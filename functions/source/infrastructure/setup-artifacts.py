@@ -8,20 +8,27 @@
 # This should always callback to the CodePipeline API to indicate success or failure
 
 
-import boto3
 import os
 import zipfile
 import json
 import uuid
-from botocore.client import Config
+from concurrent import futures
+
+import aws_clients
+import parameter_cache
 
 config_files = ["assets/pipeline/config/master-config.json", "assets/pipeline/config/config.json", "assets/pipeline/config/pipeline-config.json"]
 
 config_data = [None]*len(config_files)
 
-s3 = boto3.client('s3', config=Config(signature_version='s3v4'))
-code_pipeline = boto3.client('codepipeline')
-ssm_client = boto3.client('ssm')
+# get_parameters takes up to 10 names
+PARAMETER_BATCH_SIZE = 10
+PARAMETER_FETCH_WORKERS = 4
+
+s3 = aws_clients.client('s3', signature_version='s3v4')
+code_pipeline = aws_clients.client('codepipeline')
+ssm_client = aws_clients.client('ssm')
+parameters = parameter_cache.ParameterCache(ssm_client)
 
 def put_job_success(job_id, message):
     print('Putting job success')
@@ -44,32 +51,29 @@ def get_user_data(job_data):
     return user_data
 
 
-def get_parmeters_from_parameter_store(parameter_store_identifier):
-    ssm = boto3.client('ssm')
-    next_token = None
+def get_required_keys():
+    # the parameter keys the downloaded configurations can be populated with
+    keys = set()
+    for config in config_data:
+        keys.update(config['Parameters'].keys())
+    return sorted(keys)
+
+def get_parameters_batch(names):
+    # only SecureStrings are decrypted, other parameter types are returned as they are
+    response = ssm_client.get_parameters(Names=names, WithDecryption=True)
+    return response['Parameters']
+
+def get_parmeters_from_parameter_store(parameter_store_identifier, keys):
+    names = [parameter_store_identifier + '/' + key for key in keys]
+    batches = [names[i:i + PARAMETER_BATCH_SIZE] for i in range(0, len(names), PARAMETER_BATCH_SIZE)]
     # convert them into proper formatting we want
     store_parameters = {'Parameters': {}}
-    while True:
-        params = {
-            'Path': parameter_store_identifier,
-            'Recursive': True,
-            'WithDecryption': True
-        }
-        if next_token is not None:
-            params['NextToken'] = next_token
-
-        response = ssm.get_parameters_by_path(**params)
-
-        if len(response['Parameters']) == 0:
-            break
-        for item in response['Parameters']:
-            key = item['Name'].split('/')[-1]
-            value = item['Value']
-            store_parameters['Parameters'][key] = value
-        if 'NextToken' not in response:
-            break
-        next_token = response['NextToken']
-
+    with futures.ThreadPoolExecutor(max_workers=PARAMETER_FETCH_WORKERS) as executor:
+        for batch in executor.map(get_parameters_batch, batches):
+            for item in batch:
+                key = item['Name'].split('/')[-1]
+                store_parameters['Parameters'][key] = item['Value']
+    print('fetched %d of %d parameters in %d batches' % (len(store_parameters['Parameters']), len(names), len(batches)))
     return store_parameters
 
 
@@ -119,17 +123,14 @@ def upload_configurations(job_data):
 
 def get_parameter_from_parameter_store(param):
     try:
-        response = ssm_client.get_parameter(Name=param)
-        if 'Parameter' in response:
-            return response['Parameter']['Value']
-        return None
+        return parameters.get(param)
     except Exception as e:
         return None
 
 
 def put_parameter_into_parameter_store(name, description, value, type):
     try:
-        ssm_client.put_parameter(Name=name,Description=description,Value=value,Type=type, Overwrite=True)
+        parameters.put(name, value, type, description)
     except Exception as e:
         print('failed to put parameter %s into store, %s' % (name, str(e)))
         return None
@@ -179,12 +180,12 @@ def handler(event, context):
         # Extract the user data
         user_data = get_user_data(job_data)
 
-        # Extract parameter from parameter store
-        store_parameters = get_parmeters_from_parameter_store(user_data['ParameterStoreIdentifier'])
-
         # download default configurations from input artifacts
         download_configurations(job_data)
 
+        # Extract the parameters the configurations need from parameter store
+        store_parameters = get_parmeters_from_parameter_store(user_data['ParameterStoreIdentifier'], get_required_keys())
+
         # populate the config with store_parameters
         populate_configurations(store_parameters)
 
@@ -3,57 +3,103 @@
 # Returns: Error or status message
 #
 # updates the AWS CloudWatch dashboard
-import boto3
-import http.client
-import urllib
+import hashlib
 import json
+import os
 import uuid
-import re
 from botocore.exceptions import ClientError
 
-cloudwatch = boto3.client('cloudwatch')
+import asset_cache
+import aws_clients
+import cfn_response
+import template_engine
 
-#def validate_user_data(user_data):
-
-def render_dashboard_template(user_data):
-    s3 = boto3.client('s3')
-    response = s3.get_object(Bucket=user_data['SourceBucket'], Key=user_data['DashboardPath'])
-    dashboard_body = response['Body'].read().decode('utf-8')
-
-    dashboard_body = re.sub('@qss3bucket@', user_data['SourceBucket'], dashboard_body)
-    dashboard_body = re.sub('@qss3keyprefix@', user_data['KeyPrefix'], dashboard_body)
+cloudwatch = aws_clients.client('cloudwatch')
+assets = asset_cache.AssetCache(aws_clients.client('s3'))
 
-    dashboard_body = re.sub('@epo_elb_name@', user_data['EPOELBName'], dashboard_body)
-    dashboard_body = re.sub('@epo_console_url@', user_data['EPOConsoleURL'], dashboard_body)
-
-    dashboard_body = re.sub('@region@', user_data['Region'], dashboard_body)
-    dashboard_body = re.sub('@stack_name@', user_data['ParentStack'], dashboard_body)
-    dashboard_body = re.sub('@public_hosted_zone_id@', user_data['HostedZoneID'], dashboard_body)
-    dashboard_body = re.sub('@datastore_bucket_name@', user_data['DatastoreBucketName'], dashboard_body)
+# warn once the published body or widget count gets close to the cloudwatch dashboard limits
+DASHBOARD_BODY_LIMIT = int(os.environ.get('DASHBOARD_BODY_LIMIT_BYTES', 1024 * 1024))
+DASHBOARD_WIDGET_LIMIT = 500
+DASHBOARD_WARNING_RATIO = 0.8
 
+#def validate_user_data(user_data):
 
+def get_dashboard_values(user_data):
     # e.g https://us-west-2.console.aws.amazon.com/cloudformation/home?region=us-west-2#/stacks?filter=active&stackId=arn:aws:cloudformation:us-west-2:811797731536:stack%2Fpsdashboard%2F419bb9c0-442a-11e8-99ac-50a68a0e328e
     stack_url = 'https://' + user_data['Region'] + '.console.aws.amazon.com/cloudformation/home?region=' + user_data['Region'] + '#/stacks?filter=active&stackId=' + user_data['ParentStackID']
-    dashboard_body = re.sub('@stack_url@', stack_url, dashboard_body)
+    return {
+        'qss3bucket': user_data['SourceBucket'],
+        'qss3keyprefix': user_data['KeyPrefix'],
+
+        'epo_elb_name': user_data['EPOELBName'],
+        'epo_console_url': user_data['EPOConsoleURL'],
 
-    dashboard_body = re.sub('@epo_system_check_alarm_arn@', user_data['EPOSystemCheckAlarmARN'], dashboard_body)
-    dashboard_body = re.sub('@epo_status_check_alarm_arn@', user_data['EPOStatusCheckAlarmARN'], dashboard_body)
-    dashboard_body = re.sub('@epo_instance_id@', user_data['EPOInstanceID'], dashboard_body)
+        'region': user_data['Region'],
+        'stack_name': user_data['ParentStack'],
+        'public_hosted_zone_id': user_data['HostedZoneID'],
+        'datastore_bucket_name': user_data['DatastoreBucketName'],
+        'stack_url': stack_url,
 
-    dashboard_body = re.sub('@ah_elb_name@', user_data['AHELBName'], dashboard_body)
-    dashboard_body = re.sub('@ah_asg_name@', user_data['AHASGName'], dashboard_body)
-    dashboard_body = re.sub('@ah_scaling_alarm_arn@', user_data['AHScaleAlarmARN'], dashboard_body)
+        'epo_system_check_alarm_arn': user_data['EPOSystemCheckAlarmARN'],
+        'epo_status_check_alarm_arn': user_data['EPOStatusCheckAlarmARN'],
+        'epo_instance_id': user_data['EPOInstanceID'],
 
-    dashboard_body = re.sub('@rds_instance_id@', (user_data['DBInstanceIdentifier']).lower(), dashboard_body)
+        'ah_elb_name': user_data['AHELBName'],
+        'ah_asg_name': user_data['AHASGName'],
+        'ah_scaling_alarm_arn': user_data['AHScaleAlarmARN'],
 
-    dashboard_body = re.sub('@dxl_elb_name@', user_data['DXLELBName'], dashboard_body)
-    dashboard_body = re.sub('@dxl_asg_name@', user_data['DXLASGName'], dashboard_body)
-    dashboard_body = re.sub('@dxl_scaling_alarm_arn@', user_data['DXLScaleAlarmARN'], dashboard_body)
+        'rds_instance_id': (user_data['DBInstanceIdentifier']).lower(),
 
-    dashboard_body = re.sub('@stack_az_1@', user_data['AvailabilityZone1'], dashboard_body)
-    dashboard_body = re.sub('@stack_az_2@', user_data['AvailabilityZone2'], dashboard_body)
+        'dxl_elb_name': user_data['DXLELBName'],
+        'dxl_asg_name': user_data['DXLASGName'],
+        'dxl_scaling_alarm_arn': user_data['DXLScaleAlarmARN'],
 
-    return dashboard_body
+        'stack_az_1': user_data['AvailabilityZone1'],
+        'stack_az_2': user_data['AvailabilityZone2'],
+    }
+
+def render_dashboard_template(user_data):
+    # revalidated with a conditional GET, compiled once per version and rendered in a single join
+    dashboard_body, etag = assets.get_text(user_data['SourceBucket'], user_data['DashboardPath'])
+    template = template_engine.compile_template(dashboard_body, etag)
+    return template.render(get_dashboard_values(user_data))
+
+def minify_dashboard(dashboard_body):
+    # compact json with sorted keys, equal dashboards give equal bodies
+    return json.dumps(json.loads(dashboard_body), sort_keys=True, separators=(',', ':'))
+
+def get_dashboard_hash(dashboard_body):
+    return hashlib.sha256(minify_dashboard(dashboard_body).encode('utf-8')).hexdigest()
+
+def check_dashboard_limits(dashboard_name, dashboard_body):
+    size = len(dashboard_body.encode('utf-8'))
+    widgets = len(json.loads(dashboard_body).get('widgets', []))
+    print('dashboard %s is %d bytes with %d widgets' % (dashboard_name, size, widgets))
+    if size >= DASHBOARD_BODY_LIMIT * DASHBOARD_WARNING_RATIO:
+        print('WARNING: dashboard %s body is %d of %d bytes allowed' % (dashboard_name, size, DASHBOARD_BODY_LIMIT))
+    if widgets >= DASHBOARD_WIDGET_LIMIT * DASHBOARD_WARNING_RATIO:
+        print('WARNING: dashboard %s has %d of %d widgets allowed' % (dashboard_name, widgets, DASHBOARD_WIDGET_LIMIT))
+
+def get_published_dashboard_hash(dashboard_name):
+    try:
+        return get_dashboard_hash(cloudwatch.get_dashboard(DashboardName=dashboard_name)['DashboardBody'])
+    except ClientError as e:
+        if 'ResourceNotFound' != e.response.get('Error', {}).get('Code'):
+            print('failed to read dashboard %s, %s' % (dashboard_name, str(e)))
+        return None
+    except ValueError as e:
+        # an unreadable published body is replaced
+        print('failed to parse dashboard %s, %s' % (dashboard_name, str(e)))
+        return None
+
+def publish_dashboard(dashboard_name, dashboard_body):
+    # publishes the minified body unless the current dashboard already has the same content
+    dashboard_body = minify_dashboard(dashboard_body)
+    check_dashboard_limits(dashboard_name, dashboard_body)
+    if hashlib.sha256(dashboard_body.encode('utf-8')).hexdigest() == get_published_dashboard_hash(dashboard_name):
+        print('dashboard %s is up to date' % dashboard_name)
+        return None
+    return cloudwatch.put_dashboard(DashboardName=dashboard_name, DashboardBody=dashboard_body)
 
 def handler(event, context):
     print(event)
@@ -72,31 +118,18 @@ def handler(event, context):
     try:
         user_data = event['ResourceProperties']
         if event['RequestType'] == 'Delete':
-            return send_response(event,response, status='SUCCESS', reason="")
+            return cfn_response.send_response(event,response, status='SUCCESS', reason="")
         elif event['RequestType'] == 'Update' or event['RequestType'] == 'Create':
             dashboard_body = render_dashboard_template(user_data)
-            result = cloudwatch.put_dashboard(DashboardName=user_data['DashboardName'], DashboardBody=dashboard_body)
+            result = publish_dashboard(user_data['DashboardName'], dashboard_body)
             print(result)
-            return send_response(event, response, status='SUCCESS', reason="Successfully updated the details of dashboard")
+            return cfn_response.send_response(event, response, status='SUCCESS', reason="Successfully updated the details of dashboard")
         else:
-            return send_response(event, response, status='FAILED', reason="Invalid request type")
-    except ClientError as e:
+            return cfn_response.send_response(event, response, status='FAILED', reason="Invalid request type")
+    except (ClientError, template_engine.TemplateError) as e:
+        print(str(e))
+        return cfn_response.send_response(event, response, status='SUCCESS', reason="was not able to update dashboard")
+    except ValueError as e:
+        # the rendered dashboard body is not valid json
         print(str(e))
-        return send_response(event, response, status='SUCCESS', reason="was not able to update dashboard")
-
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+        return cfn_response.send_response(event, response, status='FAILED', reason="Invalid dashboard body, error: " + str(e))
@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 # Invoked by: Cloudwatch scheduled events
 # creates a backup AMI's with the running instance
-import boto3
 import os
 import collections
 import datetime
 import time
 import json
 
-ec2_client = boto3.client('ec2')
+import aws_clients
+
+ec2_client = aws_clients.client('ec2')
 
 
 def create_ami(instance_id, owner, stack_name, vpc_id, retention_days):
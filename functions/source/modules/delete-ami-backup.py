@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 # Invoked by: Cloudwatch scheduled events
 # delets the images associated with ec2 instance_id
-import boto3
 import os
 import collections
 import datetime
 import re
 import json
 
-ec2_client = boto3.client('ec2')
+import aws_clients
+
+ec2_client = aws_clients.client('ec2')
 
 #begins lambda function
 def handler(event, context):
@@ -19,7 +20,7 @@ def handler(event, context):
         stack_name = event['mcafee:cloudformation:stack-name']
 
         print('delete image schedule with filters instance_id %s  vpc_id %s' % (instance_id, vpc_id))
-        iam = boto3.client('iam')
+        iam = aws_clients.get_client('iam')
 
         account_ids = list()
         try:
@@ -3,33 +3,18 @@
 # Returns: Error or status message
 #
 # performs the epcation server post deployment custom action to attach certificate to the ALB
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 import re
 from botocore.exceptions import ClientError
-from base64 import b64encode
-import ssl
 import time
 
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
+import aws_clients
+import cfn_response
+import epo_remote
+import parameter_cache
 
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+parameters = parameter_cache.ParameterCache(aws_clients.client('ssm'))
 
 # epo applicaiton server ELB certificate handler for HTTPS termination at load balancer
 def epo_elb_certifcate_handler(user_data, request_type):
@@ -41,36 +26,25 @@ def epo_elb_certifcate_handler(user_data, request_type):
     ssl_policy = user_data['SslPolicy']
 
     if request_type == 'Create':
-        ssm = boto3.client('ssm')
-
         parameter_store_identifier = user_data['ParameterStoreIdentifier']
-        response = ssm.get_parameter(Name=parameter_store_identifier+'/EPOAdminUserName')
-        epo_username = response['Parameter']['Value']
-        response = ssm.get_parameter(Name=parameter_store_identifier+'/EPOAdminPassword', WithDecryption=True)
-        epo_password = response['Parameter']['Value']
-
-        auth_string = epo_username + ':' + epo_password
-        auth = b64encode(auth_string.encode()).decode("ascii")
-        headers = { 'Authorization' : 'Basic %s' %  auth }
+        epo_username = parameters.get(parameter_store_identifier+'/EPOAdminUserName')
+        epo_password = parameters.get(parameter_store_identifier+'/EPOAdminPassword', decrypt=True)
+
+        epo = epo_remote.EPOClient(epo_hostname, epo_port, epo_username, epo_password)
         # Remote command to get ePO App server ELB certificate
-        epo_cert_remote_cmd_path = '/remote/epo.command.createEPOLBCertificate?commonName=EPO_ELB_' + parent_stack_name
-        https = http.client.HTTPSConnection(epo_hostname, epo_port, context=ssl._create_unverified_context())
-        https.request('POST', epo_cert_remote_cmd_path, headers=headers)
-        response = https.getresponse()
-        print(response.status, response.reason)
-        certs_out = response.read().decode()
+        certs_out = epo.call('epo.command.createEPOLBCertificate', commonName='EPO_ELB_' + parent_stack_name)
 
         if -1 != certs_out.find('BEGIN CERTIFICATE'):
             epo_elb_cert = re.search(r"^([-]+BEGIN CERTIFICATE[-]+\s+(.*?)\s+[-]+END CERTIFICATE[-]+)", certs_out, re.MULTILINE| re.DOTALL).group(1)
             epo_elb_key  = re.search(r"^([-]+BEGIN RSA PRIVATE KEY[-]+\s+(.*?)\s+[-]+END RSA PRIVATE KEY[-]+)", certs_out, re.MULTILINE| re.DOTALL).group(1)
 
             #upload the certifcate into IAM
-            iam_client = boto3.client('iam')
+            iam_client = aws_clients.get_client('iam')
 
             response = iam_client.upload_server_certificate(ServerCertificateName=('EPO_ELB_' + parent_stack_name),CertificateBody=epo_elb_cert,PrivateKey=epo_elb_key)
             print(response)
             if 'ServerCertificateMetadata' in response:
-                elb_client = boto3.client('elbv2')
+                elb_client = aws_clients.get_client('elbv2')
                 epo_elb_cert_arn = response['ServerCertificateMetadata']['Arn']
                 print(epo_elb_cert_arn)
                 # wait 60 secs before attaching IAM cert to listener. upload may take time.
@@ -96,12 +70,12 @@ def epo_elb_certifcate_handler(user_data, request_type):
     elif request_type == 'Update':
         print('nothing to do for EPO appserver elb certificate handler in case of update request type')
     elif request_type == 'Delete':
-        iam_client = boto3.client('iam')
+        iam_client = aws_clients.get_client('iam')
 
         result = iam_client.get_server_certificate(ServerCertificateName=('EPO_ELB_' + parent_stack_name))
 
         if 'ServerCertificate' in result:
-            elb_client = boto3.client('elbv2')
+            elb_client = aws_clients.get_client('elbv2')
             epo_elb_cert_arn = result['ServerCertificate']['ServerCertificateMetadata']['Arn']
             print(epo_elb_cert_arn)
 
@@ -139,7 +113,10 @@ def handler(event, context):
         user_data = event['ResourceProperties']
         request_type = event['RequestType']
         epo_elb_certifcate_handler(user_data, request_type)
-        return send_response(event, response, status='SUCCESS', reason="succesfully applied epo applicaiton server post deployment actions")
+        return cfn_response.send_response(event, response, status='SUCCESS', reason="succesfully applied epo applicaiton server post deployment actions")
     except ClientError as e:
         print(str(e))
-        return send_response(event, response, status='FAILED', reason="Not able to complete epo applicaiton server post deployment actions")
+        return cfn_response.send_response(event, response, status='FAILED', reason="Not able to complete epo applicaiton server post deployment actions")
+    except Exception as e:
+        print(str(e))
+        return cfn_response.send_response(event, response, status='FAILED', reason="Failed to complete epo application server post deployment actions, error: " + str(e))
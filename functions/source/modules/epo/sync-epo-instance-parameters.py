@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 
-ssm = boto3.client('ssm')
+import aws_clients
+import cfn_response
+import parameter_cache
+
+ssm = aws_clients.client('ssm')
+parameters = parameter_cache.ParameterCache(ssm)
 
 def validate_user_data(user_data):
     if 'EPOImageIdParam' not in user_data:
@@ -20,40 +22,23 @@ def validate_user_data(user_data):
         raise Exception('UserData JSON must include the PassedParameters')
 
 
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-    if reason is not None:
-        response['Reason'] = reason
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
-
 def delete_parameter(name):
     try:
-        ssm.delete_parameter(Name=name)
+        parameters.delete(name)
     except Exception as e:
         print(str(e))
         print('Failed to delete image id for epo in parameter store')
 
 def update_parameter(name, description, value, type):
     try:
-        ssm.put_parameter(Name=name,Description=description,Value=value,Type=type, Overwrite=True)
+        parameters.put(name, value, type, description)
     except Exception as e:
         print('Failed to update image id for epo in parameter store')
 
 def get_parameter(name):
     try:
-        response = ssm.get_parameter(Name=name)
-        if 'Parameter' in response:
-            return response['Parameter']['Value']
-        return None
+        # update-asg-ami writes the image id, a value cached by this container may be stale
+        return parameters.get(name, fresh=True)
     except Exception as e:
         print('Parameter %s not found in parameter store' %(name))
         return None
@@ -88,7 +73,7 @@ def handler(event, context):
         print(user_data)
         if event['RequestType'] == 'Delete':
             delete_parameter(user_data['EPOImageIdParam'])
-            return send_response(event,response, status='SUCCESS', reason="Successfully deleted EPO Image ID from paramstore")
+            return cfn_response.send_response(event,response, status='SUCCESS', reason="Successfully deleted EPO Image ID from paramstore")
         elif event['RequestType'] == 'Update' or event['RequestType'] == 'Create':
             # If UsePreviousValue is 1 which means use it from existing
             if "0" != user_data['UsePreviousValue']:
@@ -96,9 +81,9 @@ def handler(event, context):
 
             response['Data'] = {'EPOImageId': new_params['EPOImageId'], 'EPOInstanceType': new_params['EPOInstanceType'], 'EPOInstanceSize': new_params['EPOInstanceSize']}
             print(response['Data'])
-            return send_response(event, response, status='SUCCESS', reason="Successfully synced of ePO Instance parameters")
+            return cfn_response.send_response(event, response, status='SUCCESS', reason="Successfully synced of ePO Instance parameters")
         else:
             raise Exception('Invalid Request Type.')
     except Exception as e:
         print(str(e))
-        return send_response(event, response, status='FAILED', reason="Failed to sync ePO instance parameters")
+        return cfn_response.send_response(event, response, status='FAILED', reason="Failed to sync ePO instance parameters")
@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
-import boto3
-import http.client
-import urllib
 import json
 import uuid
 import time
 
-client = boto3.client('autoscaling')
+import aws_clients
+import cfn_response
+
+client = aws_clients.client('autoscaling')
 
 
 # Wait max 3 mints
@@ -40,7 +40,7 @@ def handler(event, context):
         #return send_response(event, response, status='SUCCESS', reason="Successfully got details of RDS instance identifier")
 
         if event['RequestType'] == 'Delete' or event['RequestType'] == 'Create':
-            return send_response(event,response, status='SUCCESS', reason="")
+            return cfn_response.send_response(event,response, status='SUCCESS', reason="")
         elif event['RequestType'] == 'Update':
             try:
                 asg_name = event['OldResourceProperties']['AutoScalingGroupName']
@@ -49,35 +49,17 @@ def handler(event, context):
                 if result['ResponseMetadata']['HTTPStatusCode'] == 200:
                     ret = waitForInstanceCountToZero(asg_name)
                     if ret == 0:
-                        return send_response(event, response, status='SUCCESS', reason="Successfully set min/max/desired for old ASG")
+                        return cfn_response.send_response(event, response, status='SUCCESS', reason="Successfully set min/max/desired for old ASG")
                     else:
-                        return send_response(event, response, status='FAILED', reason="Tiemout on get instance count")
+                        return cfn_response.send_response(event, response, status='FAILED', reason="Tiemout on get instance count")
                 else:
-                    return send_response(event, response, status='FAILED', reason="Failed to set ASG min/max/desired for old ASG")
+                    return cfn_response.send_response(event, response, status='FAILED', reason="Failed to set ASG min/max/desired for old ASG")
             except Exception as e:
                 print(response)
                 print(str(e))
-                return send_response(event, response, status='FAILED', reason="Exception on execution")
+                return cfn_response.send_response(event, response, status='FAILED', reason="Exception on execution")
         else:
-            return send_response(event, response, status='FAILED', reason="Invalid request type")
+            return cfn_response.send_response(event, response, status='FAILED', reason="Invalid request type")
     except Exception as e:
         print(str(e))
-        return send_response(event, response, status='FAILED', reason="Main Exception.")
-
-
-def send_response(request, response, status=None, reason=None):
-    if status is not None:
-        response['Status'] = status
-
-    if reason is not None:
-        response['Reason'] = reason
-
-    if 'ResponseURL' in request and request['ResponseURL']:
-        try:
-            url= urllib.parse.urlparse(request['ResponseURL'])
-            body = json.dumps(response)
-            https = http.client.HTTPSConnection(url.hostname)
-            https.request('PUT', url.path + '?' + url.query, body)
-        except Exception as e:
-            print(str(e))
-            print("Failed to send the response to the provdided URL")
+        return cfn_response.send_response(event, response, status='FAILED', reason="Main Exception.")
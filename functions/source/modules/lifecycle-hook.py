@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-import boto3
 import json
 import logging
 import time
 import os
 import time
 
+import aws_clients
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
-ssm_client = boto3.client("ssm")
+ssm_client = aws_clients.client("ssm")
 
 def check_response(response):
     try:
@@ -88,7 +89,7 @@ def check_command(command_id, instance_id):
         return False
 
 def update_lifecycle(lifecycle_hook, auto_scaling_group, instance_id, status):
-    asg_client = boto3.client('autoscaling')
+    asg_client = aws_clients.get_client('autoscaling')
     try:
         response = asg_client.complete_lifecycle_action(
             LifecycleHookName=lifecycle_hook,
@@ -3,15 +3,14 @@
 # Returns: Error or status message
 #
 # setups the ASG image id
-import boto3
-import http.client
-import urllib
 import json
 import datetime
 import time
 import os
 
-asg_client = boto3.client('autoscaling')
+import aws_clients
+
+asg_client = aws_clients.client('autoscaling')
 
 def validate_user_data(user_data):
     if 'AutoScalingGroupName' not in user_data:
@@ -43,7 +42,7 @@ def create_launch_configuration(instance_id, lc, new_image_id):
 
 def update_parameter(name, description, value, type):
     try:
-        ssm = boto3.client('ssm')
+        ssm = aws_clients.get_client('ssm')
         ssm.put_parameter(Name=name,Description=description,Value=value,Type=type, Overwrite=True)
     except Exception as e:
         print('Failed to update image id for epo in parameter store')